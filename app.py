@@ -1,65 +1,203 @@
 # app.py
-from flask import Flask, render_template, request, redirect, url_for, session
-from werkzeug.security import check_password_hash
+from flask import Flask, Response, jsonify, make_response, render_template, request, redirect, url_for, session
+import base64
+import click
+import csv
+import functools
 import hashlib
+import inspect
+import io
+import json
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 import config
+import db
+import hll
+import migrations
+import passwords
+import prereqs
+import scheduler
+import search
+import timetable
+from cache import BoundedCache, ReferenceCache, ReportCache, VersionStamps, freeze_rows
 
 app = Flask(__name__)
 
 app.secret_key = config.SECRET_KEY
+db.init_app(app)
+migrations.init_app(app)
+
+# Emails that recently matched no account; absorbs repeated unknown-email login attempts.
+unknown_emails = BoundedCache(maxsize=getattr(config, 'LOGIN_NEGATIVE_CACHE_SIZE', 10000),
+                              ttl=getattr(config, 'LOGIN_NEGATIVE_CACHE_TTL', 60))
+
+# Reference data (courses, departments, classrooms, timeslots, buildings, instructors) is served
+# from frozen in-process snapshots. Each entity's create_/update_/delete_ helpers call
+# bump_reference() after committing; REFERENCE_CACHE_MAX_AGE bounds staleness across processes.
+reference_data = ReferenceCache(max_age=getattr(config, 'REFERENCE_CACHE_MAX_AGE', 300))
+
+# reference entities joined into each student's cached enrollment list
+ENROLLMENT_REFERENCES = {'courses', 'instructors', 'classrooms', 'buildings', 'timeslots'}
+
+def bump_reference(*entities):
+    def bump():
+        for entity in entities:
+            reference_data.bump(entity)
+        if ENROLLMENT_REFERENCES.intersection(entities):
+            for key in student_data.keys():
+                if key[0] == 'enrollments':
+                    student_data.pop(key)
+        if 'timeslots' in entities:
+            # cached timetables hold each section's meeting minutes
+            student_timetables.clear()
+        if 'timeslots' in entities or 'classrooms' in entities:
+            term_schedules.clear()
+    db.after_commit(bump)
+
+# Per-student page data: each student's profile and enrollment list, loaded once and shared by the
+# dashboard, grades, manage-courses and registration code. Writes to a student's rows call
+# forget_students() after commit; reference data edits drop every cached enrollment list.
+student_data = BoundedCache(maxsize=getattr(config, 'STUDENT_CACHE_SIZE', 5000),
+                            ttl=getattr(config, 'STUDENT_CACHE_TTL', 300))
+
+def forget_students(student_ids, enrollments=True, profile=False):
+    student_ids = [int(sid) for sid in student_ids]
+    def forget():
+        for student_id in student_ids:
+            if enrollments:
+                student_data.pop(('enrollments', student_id))
+            if profile:
+                student_data.pop(('profile', student_id))
+    db.after_commit(forget)
+
+# Conditional GET: section listings and rosters carry an ETag built from data version stamps,
+# ('catalog', semester, year), ('instructor', instructorID), ('roster', sectionID) and ('sections',)
+# for listings across terms, plus the reference data versions the page joins. Section and
+# enrollment writes bump the stamps of the sections they touch after commit, so a matching
+# If-None-Match is answered 304 before the view runs any query.
+page_versions = VersionStamps(max_age=getattr(config, 'REFERENCE_CACHE_MAX_AGE', 300))
+
+def section_pages(section_id, semester, year, instructor_id):
+    """Stamp keys of the pages that show a section."""
+    return [('sections',), ('catalog', semester, int(year)), ('instructor', instructor_id), ('roster', int(section_id))]
+
+def find_section_pages(cur, where, params):
+    """Stamp keys of the pages showing the sections matching `where` (caller's cursor, before the write)."""
+    cur.execute(f"SELECT sectionID, semester, year, instructorID FROM Section WHERE {where}", params)
+    keys = set()
+    for row in cur.fetchall():
+        if not isinstance(row, dict):
+            row = dict(zip(cur.column_names, row))
+        keys.update(section_pages(row['sectionID'], row['semester'], row['year'], row['instructorID']))
+    return keys
+
+def bump_pages(keys):
+    keys = list(keys)
+    def bump():
+        for key in keys:
+            page_versions.bump(key)
+    db.after_commit(bump)
+
+def conditional_page(stamp_keys, references=()):
+    """
+    Route decorator adding an ETag to a GET page. `stamp_keys(**view_args)` returns
+    the page's stamp keys, or None to skip (e.g. not signed in). The tag also covers the signed-in
+    user and the full URL, so it only matches that user's earlier copy of the same page.
+    No Last-Modified: a date can't carry the user and URL, so If-Modified-Since isn't safe to answer.
+    """
+    def decorate(view):
+        @functools.wraps(view)
+        def wrapper(**view_args):
+            keys = stamp_keys(**view_args)
+            if keys is None:
+                return view(**view_args)
+            stamps = [page_versions.stamp(key) for key in keys]
+            tag_source = [session.get('user_type'), session.get('user_id'), session.get('user_name'),
+                          request.full_path, stamps, [reference_data.version(e) for e in references]]
+            etag = hashlib.sha1(json.dumps(tag_source, default=str).encode('utf-8')).hexdigest()
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+            else:
+                response = make_response(view(**view_args))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorate
+
+def signed_in_as(user_type):
+    return 'user_id' in session and session.get('user_type') == user_type
+
+IDENTITY_SOURCES = {
+    'admin': ('Admin', 'adminID'),
+    'instructor': ('Instructor', 'instructorID'),
+    'student': ('Student', 'studentID'),
+}
 
-def verify_password(stored_password: str, provided_password: str) -> bool:
-
-    if not stored_password:
-        return False
-
-    stored = stored_password.strip()
-
-    if len(stored) == 64 and all(c in "0123456789abcdefABCDEF" for c in stored):
-        provided_hash = hashlib.sha256(provided_password.encode('utf-8')).hexdigest()
-        return provided_hash.lower() == stored.lower()
-    # If stored password is not a plain hex sha256, try werkzeug's check for salted hashes
-    try:
-        return bool(check_password_hash(stored, provided_password))
-    except Exception:
-        return False
-    
 
 def get_user_by_email(email):
-    conn = config.get_db_connection()
+    """Resolve a login email to its account (admin, instructor or student) with one indexed lookup."""
+    key = email.lower()
+    if unknown_emails.get(key, None):
+        return None
+
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor(dictionary=True)
-
-        # check for admin
-        cur.execute("SELECT adminID AS id, first_name, last_name, email, password FROM Admin WHERE email = %s", (email,))
-        row = cur.fetchone()
-        if row:
-            row['type'] = 'admin'
-            return row
-
-        # check for instructor
-        cur.execute("SELECT instructorID AS id, first_name, last_name, email, password FROM Instructor WHERE email = %s", (email,))
-        row = cur.fetchone()
-        if row:
-            row['type'] = 'instructor'
-            return row
-
-        # check for student
-        cur.execute("SELECT studentID AS id, first_name, last_name, email, password FROM Student WHERE email = %s", (email,))
+        cur.execute("""
+            SELECT ui.role AS type, ui.userID AS id, ui.email, ui.password,
+                   COALESCE(a.first_name, i.first_name, s.first_name) AS first_name,
+                   COALESCE(a.last_name, i.last_name, s.last_name) AS last_name
+            FROM UserIdentity ui
+            LEFT JOIN Admin a ON ui.role = 'admin' AND a.adminID = ui.userID
+            LEFT JOIN Instructor i ON ui.role = 'instructor' AND i.instructorID = ui.userID
+            LEFT JOIN Student s ON ui.role = 'student' AND s.studentID = ui.userID
+            WHERE ui.email = %s
+        """, (email,))
         row = cur.fetchone()
-        if row:
-            row['type'] = 'student'
-            return row
-
-        return None
+        if not row:
+            unknown_emails.set(key, True)
+        return row
     finally:
         cur.close()
         conn.close()
 
 
-def get_student_profile(student_id):
-    """Return student profile dictionary for the given student_id or None, including advisor info."""
-    conn = config.get_db_connection()
+class EmailInUse(ValueError):
+    """Raised when an account's email already belongs to an account of another role."""
+
+def sync_identity(conn, cur, role, user_id, email=None):
+    """
+    Rewrite the UserIdentity row for one account from its source table, using the caller's
+    cursor so it commits (or rolls back) together with the account change.
+    Emails are unique across roles: if another account has this one, roll back and raise EmailInUse.
+    Pass the new email so a cached "unknown email" entry is dropped.
+    """
+    table, id_col = IDENTITY_SOURCES[role]
+    cur.execute(f"SELECT email FROM {table} WHERE {id_col} = %s", (user_id,))
+    row = cur.fetchone()
+    account_email = row['email'] if isinstance(row, dict) else row[0]
+    # locking read: also holds the key so a concurrent insert of the same email waits
+    cur.execute("SELECT role, userID FROM UserIdentity WHERE email = %s FOR UPDATE", (account_email,))
+    for other in cur.fetchall():
+        other = other if isinstance(other, dict) else dict(zip(('role', 'userID'), other))
+        if (other['role'], other['userID']) != (role, int(user_id)):
+            conn.rollback()
+            raise EmailInUse(f"{account_email} is already used by another account.")
+    cur.execute("DELETE FROM UserIdentity WHERE role = %s AND userID = %s", (role, user_id))
+    cur.execute(f"INSERT INTO UserIdentity (email, role, userID, password) "
+                f"SELECT email, %s, {id_col}, password FROM {table} WHERE {id_col} = %s", (role, user_id))
+    if email:
+        unknown_emails.pop(email.lower())
+
+
+def load_student_profile(student_id):
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor(dictionary=True)
         cur.execute("""
@@ -74,11 +212,15 @@ def get_student_profile(student_id):
         """, (student_id,))
         # give the student info with advisor info if any
         row = cur.fetchone()
-        return row
+        return freeze_rows([row])[0] if row else None
     finally:
         cur.close()
         conn.close()
 
+def get_student_profile(student_id):
+    """Return student profile (read-only mapping) for the given student_id or None, including advisor info."""
+    return student_data.get_or_load(('profile', int(student_id)), lambda: load_student_profile(student_id))
+
 
 
 @app.route('/', methods=['GET'])
@@ -99,7 +241,11 @@ def login():
     if not user:
         return render_template('index.html', error="No account found with that email.")
 
-    if not verify_password(user['password'], password):
+    try:
+        password_ok = passwords.check_password(user['password'], password)
+    except passwords.VerifierBusy:
+        return render_template('index.html', error="Too many sign-ins right now, please try again in a moment."), 503
+    if not password_ok:
         return render_template('index.html', error="Incorrect password.")
 
     # if success store user info in session
@@ -146,14 +292,14 @@ def dashboard():
 
 
 # --- Student helper: get all enrollments with useful joins ---
-def get_student_enrollments(student_id):
-    conn = config.get_db_connection()
+def load_student_enrollments(student_id):
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor(dictionary=True)
         cur.execute("""
             SELECT
               e.enrollmentID, e.grade, e.status,
-              s.sectionID, s.semester, s.year,
+              s.sectionID, s.semester, s.year, s.termID,
               c.courseID, c.course_name, c.course_number, c.credits,
               i.instructorID, i.first_name AS instr_first, i.last_name AS instr_last,
               t.day_of_week, TIME_FORMAT(t.start_time, '%%H:%%i') AS start_time,
@@ -161,19 +307,24 @@ def get_student_enrollments(student_id):
               cl.room_number, b.building_name
             FROM Enrollment e
             JOIN Section s ON e.sectionID = s.sectionID
+            JOIN Term tm ON s.termID = tm.termID
             JOIN Course c ON s.courseID = c.courseID
             LEFT JOIN Instructor i ON s.instructorID = i.instructorID
             LEFT JOIN Timeslot t ON s.timeslotID = t.timeslotID
             LEFT JOIN Classroom cl ON s.classroomID = cl.classroomID
             LEFT JOIN Building b ON cl.buildingID = b.buildingID
             WHERE e.studentID = %s
-            ORDER BY s.year DESC, s.semester DESC, c.course_number
+            ORDER BY tm.ordinal DESC, c.course_number
         """, (student_id,))
-        return cur.fetchall()
+        return freeze_rows(cur.fetchall())
     finally:
         cur.close()
         conn.close()
 
+def get_student_enrollments(student_id):
+    """The student's enrollments, newest term first, as shared read-only rows."""
+    return student_data.get_or_load(('enrollments', int(student_id)), lambda: load_student_enrollments(student_id))
+
 
 # --- Grades page route ---
 @app.route('/student/grades')
@@ -201,43 +352,142 @@ def student_grades():
 # --------------------------
 # Helpers for sections & registration
 # --------------------------
+# Terms: Term(termID, semester, year, ordinal) with ordinal = year * 10 + semester order, so term
+# ranges and "most recent first" sorting are integer comparisons on an indexed column.
+SEMESTER_ORDER = {"Spring": 1, "Summer": 2, "Fall": 3}
+
+def canonical_semester(value):
+    """The SEMESTER_ORDER spelling of a semester name given in any case, or None if unknown."""
+    return next((name for name in SEMESTER_ORDER if value and name.lower() == value.strip().lower()), None)
+
+def term_ordinal(semester, year, default_order=4):
+    return int(year) * 10 + SEMESTER_ORDER.get(semester, default_order)
+
+def ensure_term(cur, semester, year):
+    """Return the termID for (semester, year), creating the Term row if needed (caller's cursor)."""
+    cur.execute("INSERT IGNORE INTO Term (semester, year, ordinal) VALUES (%s, %s, %s)",
+                (semester, year, term_ordinal(semester, year)))
+    if cur.rowcount:
+        current_term_cache.pop('ordinal')
+        current_term_cache.pop('term')
+    cur.execute("SELECT termID FROM Term WHERE semester = %s AND year = %s", (semester, year))
+    return cur.fetchone()[0]
+
+def get_current_term():
+    """The latest term sections are offered in, as a dict (termID, semester, year, ordinal) or None."""
+    conn = db.get_db_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        cur.execute("SELECT termID, semester, year, ordinal FROM Term ORDER BY ordinal DESC LIMIT 1")
+        return cur.fetchone()
+    finally:
+        cur.close()
+        conn.close()
+
+def cached_current_term():
+    """get_current_term() cached for a minute (new terms drop it), for pages that default to the current term."""
+    term = current_term_cache.get('term', None)
+    if term is None:
+        term = get_current_term() or {}
+        current_term_cache.set('term', term)
+    return term or None
+
+def release_seat(cur, enrollment_id):
+    """
+    Give back the seat held by an enrollment if it is still 'enrolled'. Call on the caller's
+    cursor before changing the enrollment's status so both commit together.
+    """
+    cur.execute("""
+        UPDATE Section s JOIN Enrollment e ON e.sectionID = s.sectionID
+        SET s.enrolled_count = s.enrolled_count - 1
+        WHERE e.enrollmentID = %s AND e.status = 'enrolled'
+    """, (enrollment_id,))
+
+
+def reconcile_seat_counts():
+    """
+    Rebuild Section.enrolled_count from Enrollment. Returns the sections whose stored count
+    was wrong as (sectionID, stored, actual) tuples.
+    """
+    conn = db.get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT s.sectionID, s.enrolled_count, COUNT(e.enrollmentID)
+            FROM Section s
+            LEFT JOIN Enrollment e ON e.sectionID = s.sectionID AND e.status = 'enrolled'
+            GROUP BY s.sectionID, s.enrolled_count
+            HAVING s.enrolled_count <> COUNT(e.enrollmentID)
+        """)
+        drift = cur.fetchall()
+        cur.execute("""
+            UPDATE Section s
+            LEFT JOIN (SELECT sectionID, COUNT(*) AS n FROM Enrollment WHERE status = 'enrolled' GROUP BY sectionID) x
+              ON x.sectionID = s.sectionID
+            SET s.enrolled_count = COALESCE(x.n, 0)
+        """)
+        conn.commit()
+        if drift:
+            db.after_commit(page_versions.clear)
+        return drift
+    finally:
+        cur.close()
+        conn.close()
+
+
+@app.cli.command('reconcile-seats')
+def reconcile_seats_command():
+    """Recount enrolled seats per section from Enrollment."""
+    drift = reconcile_seat_counts()
+    for section_id, stored, actual in drift:
+        click.echo(f"section {section_id}: stored {stored}, actual {actual}")
+    click.echo(f"{len(drift)} section count(s) corrected")
+
+
+SECTION_LISTING_SQL = """
+    SELECT
+      s.sectionID, s.semester, s.year, s.capacity, s.termID, tm.ordinal,
+      c.courseID, c.course_name, c.course_number, c.credits,
+      i.instructorID, i.first_name AS instr_first, i.last_name AS instr_last,
+      t.day_of_week, TIME_FORMAT(t.start_time, '%%H:%%i') AS start_time,
+      TIME_FORMAT(t.end_time, '%%H:%%i') AS end_time,
+      cl.room_number, b.building_name,
+      s.enrolled_count
+    FROM Section s
+    JOIN Term tm ON s.termID = tm.termID
+    JOIN Course c ON s.courseID = c.courseID
+    LEFT JOIN Instructor i ON s.instructorID = i.instructorID
+    LEFT JOIN Timeslot t ON s.timeslotID = t.timeslotID
+    LEFT JOIN Classroom cl ON s.classroomID = cl.classroomID
+    LEFT JOIN Building b ON cl.buildingID = b.buildingID
+"""
+
 def get_sections(semester=None, year=None, course_filter=None):
     """
     Return a list of sections with joined course/instructor/room/time info and current enrolled count.
-    Optionally filter by semester, year, and course number/name fragment.
+    Optionally filter by semester, year, and course number/name fragment (matched through the
+    course search index).
     """
-    conn = config.get_db_connection()
+    course_ids = None
+    if course_filter:
+        course_ids = get_course_index().matching_ids(course_filter)
+        if not course_ids:
+            return []
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor(dictionary=True)
-        sql = """
-            SELECT
-              s.sectionID, s.semester, s.year, s.capacity,
-              c.courseID, c.course_name, c.course_number, c.credits,
-              i.instructorID, i.first_name AS instr_first, i.last_name AS instr_last,
-              t.day_of_week, TIME_FORMAT(t.start_time, '%%H:%%i') AS start_time,
-              TIME_FORMAT(t.end_time, '%%H:%%i') AS end_time,
-              cl.room_number, b.building_name,
-              (SELECT COUNT(*) FROM Enrollment e WHERE e.sectionID = s.sectionID AND e.status='enrolled') AS enrolled_count
-            FROM Section s
-            JOIN Course c ON s.courseID = c.courseID
-            LEFT JOIN Instructor i ON s.instructorID = i.instructorID
-            LEFT JOIN Timeslot t ON s.timeslotID = t.timeslotID
-            LEFT JOIN Classroom cl ON s.classroomID = cl.classroomID
-            LEFT JOIN Building b ON cl.buildingID = b.buildingID
-            WHERE 1=1
-        """
+        sql = SECTION_LISTING_SQL + " WHERE 1=1"
         params = []
         if semester:
-            sql += " AND s.semester = %s"
+            sql += " AND tm.semester = %s"
             params.append(semester)
         if year:
-            sql += " AND s.year = %s"
+            sql += " AND tm.year = %s"
             params.append(year)
-        if course_filter:
-            sql += " AND (c.course_number LIKE %s OR c.course_name LIKE %s)"
-            like = f"%{course_filter}%"
-            params.extend([like, like])
-        sql += " ORDER BY s.year DESC, s.semester DESC, c.course_number"
+        if course_ids is not None:
+            sql += f" AND c.courseID IN ({','.join(['%s'] * len(course_ids))})"
+            params.extend(sorted(course_ids))
+        sql += " ORDER BY tm.ordinal DESC, c.course_number"
         cur.execute(sql, tuple(params))
         return cur.fetchall()
     finally:
@@ -274,11 +524,11 @@ def student_drop():
     if not enrollment_id:
         return redirect(url_for('student_courses'))
 
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor()
         # verify ownership and status
-        cur.execute("SELECT status FROM Enrollment WHERE enrollmentID=%s AND studentID=%s", (enrollment_id, student_id))
+        cur.execute("SELECT status, sectionID FROM Enrollment WHERE enrollmentID=%s AND studentID=%s", (enrollment_id, student_id))
         row = cur.fetchone()
         if not row:
             # nothing to drop
@@ -286,8 +536,14 @@ def student_drop():
             conn.close()
             return redirect(url_for('student_courses'))
         # perform logical drop
+        pages = find_section_pages(cur, "sectionID = %s", (row[1],))
+        release_seat(cur, enrollment_id)
         cur.execute("UPDATE Enrollment SET status='dropped' WHERE enrollmentID=%s AND studentID=%s", (enrollment_id, student_id))
         conn.commit()
+        invalidate_reports('enrollments')
+        forget_students([student_id])
+        bump_pages(pages)
+        db.after_commit(lambda: timetable_drop(student_id, row[1]))
     finally:
         cur.close()
         conn.close()
@@ -295,7 +551,29 @@ def student_drop():
     return redirect(url_for('student_courses'))
 
 
+def course_info_pages():
+    if not signed_in_as('student'):
+        return None
+    semester = request.args.get('semester')
+    year = request.args.get('year')
+    if semester:
+        # writes bump the stamp under the canonical name; anything else would never be bumped
+        semester = canonical_semester(semester)
+        if semester is None:
+            return None
+    if not semester or not year:
+        current = cached_current_term()
+        if not current:
+            return [('sections',)]
+        semester = semester or current['semester']
+        year = year or current['year']
+    try:
+        return [('catalog', semester, int(year))]
+    except ValueError:
+        return None
+
 @app.route('/student/course-info', methods=['GET'])
+@conditional_page(course_info_pages, references=('courses', 'instructors', 'classrooms', 'buildings', 'timeslots'))
 def student_course_info():
     """
     Course Info page: show sections by semester/year or search by course number/name.
@@ -304,8 +582,13 @@ def student_course_info():
     if 'user_id' not in session or session.get('user_type') != 'student':
         return redirect(url_for('index'))
 
-    semester = request.args.get('semester') or 'Fall'
-    year = request.args.get('year') or 2025
+    semester = request.args.get('semester')
+    semester = canonical_semester(semester) or semester
+    year = request.args.get('year')
+    if not semester or not year:
+        current = cached_current_term()
+        semester = semester or (current['semester'] if current else None)
+        year = year or (current['year'] if current else None)
     q = request.args.get('q') or None
 
     sections = get_sections(semester=semester, year=year, course_filter=q)
@@ -316,10 +599,191 @@ def student_course_info():
         semester=semester,
         year=year,
         q=q,
+        message=request.args.get('message'),
         user_name=session.get('user_name')
     )
 
 
+@app.route('/courses/autocomplete', methods=['GET'])
+def course_autocomplete():
+    """Ranked course matches for a search box. Query params: q, limit (default 10, at most 50)."""
+    if 'user_id' not in session:
+        return jsonify([]), 401
+    try:
+        limit = min(max(int(request.args.get('limit') or 10), 1), 50)
+    except ValueError:
+        limit = 10
+    return jsonify(get_course_index().search(request.args.get('q', ''), limit))
+
+
+# Student timetables: a timetable.IntervalIndex of each student's enrolled sections, partitioned
+# by (termID, day_of_week) and cached per student. Registration checks it for clashes; register
+# and drop update the cached copy after commit, section moves clear them all.
+student_timetables = BoundedCache(maxsize=getattr(config, 'TIMETABLE_CACHE_SIZE', 5000),
+                                  ttl=getattr(config, 'TIMETABLE_CACHE_TTL', 300))
+
+def get_timeslot(timeslot_id):
+    return next((t for t in get_all_timeslots() if t['timeslotID'] == timeslot_id), None)
+
+def get_student_timetable(cur, student_id):
+    """The student's cached timetable, built on the caller's cursor when it isn't cached."""
+    index = student_timetables.get(student_id, None)
+    if index is None:
+        cur.execute("""
+            SELECT s.sectionID, s.termID, t.day_of_week, t.start_time, t.end_time
+            FROM Enrollment e
+            JOIN Section s ON s.sectionID = e.sectionID
+            JOIN Timeslot t ON t.timeslotID = s.timeslotID
+            WHERE e.studentID = %s AND e.status = 'enrolled'
+        """, (student_id,))
+        index = timetable.IntervalIndex()
+        for r in cur.fetchall():
+            index.add((r['termID'], r['day_of_week']), timetable.to_minutes(r['start_time']),
+                      timetable.to_minutes(r['end_time']), r['sectionID'])
+        student_timetables.set(student_id, index)
+    return index
+
+def timetable_conflicts(cur, student_id, term_id, slot, section_id=None):
+    """
+    Sections in the student's timetable for that term that overlap `slot` (a Timeslot row).
+    Runs on the caller's dictionary cursor, so a caller holding row locks needs no second connection.
+    """
+    if not slot:
+        return []
+    return get_student_timetable(cur, student_id).overlapping(
+        (term_id, slot['day_of_week']), timetable.to_minutes(slot['start_time']),
+        timetable.to_minutes(slot['end_time']), exclude=section_id)
+
+def timetable_add(student_id, section_id, term_id, timeslot_id):
+    index = student_timetables.get(student_id, None)
+    slot = get_timeslot(timeslot_id) if timeslot_id else None
+    if index is not None and slot:
+        index.add((term_id, slot['day_of_week']), timetable.to_minutes(slot['start_time']),
+                  timetable.to_minutes(slot['end_time']), section_id)
+
+def timetable_drop(student_id, section_id):
+    index = student_timetables.get(student_id, None)
+    if index is not None:
+        index.remove(section_id)
+
+def audit_term_timetables(semester, year):
+    """
+    Every clash in any student's timetable for one term, as (studentID, day_of_week, sectionID,
+    sectionID) tuples, from one query and one sweep.
+    """
+    conn = db.get_db_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        cur.execute("""
+            SELECT e.studentID, e.sectionID, t.day_of_week, t.start_time, t.end_time
+            FROM Enrollment e
+            JOIN Section s ON s.sectionID = e.sectionID
+            JOIN Term tm ON tm.termID = s.termID
+            JOIN Timeslot t ON t.timeslotID = s.timeslotID
+            WHERE tm.semester = %s AND tm.year = %s AND e.status = 'enrolled'
+        """, (semester, year))
+        intervals = [((r['studentID'], r['day_of_week']), timetable.to_minutes(r['start_time']),
+                      timetable.to_minutes(r['end_time']), r['sectionID']) for r in cur.fetchall()]
+    finally:
+        cur.close()
+        conn.close()
+    return [(student_id, day, a, b) for (student_id, day), a, b in timetable.find_conflicts(intervals)]
+
+@app.cli.command('audit-timetables')
+@click.option('--semester', default=None, help='Defaults to the current term.')
+@click.option('--year', type=int, default=None)
+def audit_timetables_command(semester, year):
+    """List students enrolled in overlapping sections in one term."""
+    if not semester or not year:
+        current = get_current_term()
+        if not current:
+            click.echo("no terms")
+            return
+        semester, year = current['semester'], current['year']
+    conflicts = audit_term_timetables(semester, year)
+    for student_id, day, a, b in conflicts:
+        click.echo(f"student {student_id}: sections {a} and {b} overlap on {day}")
+    click.echo(f"{len(conflicts)} timetable conflict(s) in {semester} {year}")
+
+
+# Registration outcomes returned by register_student
+REGISTERED = 'registered'
+SECTION_FULL = 'full'
+ALREADY_ENROLLED = 'duplicate'
+UNKNOWN_SECTION = 'unknown_section'
+MISSING_PREREQS = 'missing_prereqs'
+TIME_CONFLICT = 'time_conflict'
+
+REGISTRATION_MESSAGES = {
+    SECTION_FULL: "That section is full.",
+    ALREADY_ENROLLED: "You are already registered for that section.",
+    UNKNOWN_SECTION: "That section does not exist.",
+    MISSING_PREREQS: "You have not completed the prerequisites for that course.",
+    TIME_CONFLICT: "That section meets at the same time as one you are already registered for.",
+}
+
+
+def register_student(student_id, section_id):
+    """
+    Enroll a student in a section as one transaction and return an outcome code
+    (REGISTERED, SECTION_FULL, ALREADY_ENROLLED, UNKNOWN_SECTION, MISSING_PREREQS or TIME_CONFLICT).
+    The section row is locked first, so concurrent registrations for the same section are
+    serialized and the capacity check cannot be raced past. Everything read while the row is
+    locked goes through the same connection.
+    """
+    graph = get_prereq_graph()
+    timeslots = {t['timeslotID']: t for t in get_all_timeslots()}
+    conn = db.get_db_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        cur.execute("""
+            SELECT s.courseID, s.termID, s.timeslotID, s.capacity, s.enrolled_count,
+                   s.semester, s.year, s.instructorID,
+                   e.enrollmentID, e.status, e.grade_points
+            FROM Section s
+            LEFT JOIN Enrollment e ON e.sectionID = s.sectionID AND e.studentID = %s
+            WHERE s.sectionID = %s
+            FOR UPDATE
+        """, (student_id, section_id))
+        row = cur.fetchone()
+        if not row:
+            conn.rollback()
+            return UNKNOWN_SECTION
+        if row['enrollmentID'] and row['status'] != 'dropped':
+            conn.rollback()
+            return ALREADY_ENROLLED
+        if row['enrolled_count'] >= row['capacity']:
+            conn.rollback()
+            return SECTION_FULL
+        if graph.direct.get(row['courseID']) and graph.missing(row['courseID'], get_completed_courses(cur, student_id)):
+            conn.rollback()
+            return MISSING_PREREQS
+        if row['timeslotID'] and timetable_conflicts(cur, student_id, row['termID'], timeslots.get(row['timeslotID']), int(section_id)):
+            conn.rollback()
+            return TIME_CONFLICT
+
+        if row['enrollmentID']:
+            # re-registering after a drop reuses the (studentID, sectionID) row
+            cur.execute("UPDATE Enrollment SET status='enrolled', grade='TBD', grade_points=NULL WHERE enrollmentID=%s", (row['enrollmentID'],))
+            apply_grade_summary_delta(cur, section_id, *grade_delta(row['grade_points'], None))
+        else:
+            cur.execute("INSERT INTO Enrollment (studentID, sectionID, grade, status) VALUES (%s,%s,'TBD','enrolled')", (student_id, section_id))
+            record_department_headcount(cur, section_id, student_id)
+        cur.execute("UPDATE Section SET enrolled_count = enrolled_count + 1 WHERE sectionID=%s", (section_id,))
+        conn.commit()
+        invalidate_reports('enrollments')
+        forget_students([student_id])
+        bump_pages(section_pages(section_id, row['semester'], row['year'], row['instructorID']))
+        db.after_commit(lambda: timetable_add(student_id, int(section_id), row['termID'], row['timeslotID']))
+        if row['grade_points'] is not None:
+            # the reactivated row's old grade left the summaries
+            invalidate_reports('grades')
+        return REGISTERED
+    finally:
+        cur.close()
+        conn.close()
+
+
 @app.route('/student/register', methods=['POST'])
 def student_register():
     """
@@ -334,41 +798,86 @@ def student_register():
     if not section_id:
         return redirect(url_for('student_course_info'))
 
-    conn = config.get_db_connection()
-    try:
-        cur = conn.cursor(dictionary=True)
-
-        # 1) Check already enrolled in the section
-        cur.execute("SELECT 1 AS found FROM Enrollment WHERE studentID=%s AND sectionID=%s AND status='enrolled'", (student_id, section_id))
-        if cur.fetchone():
-            cur.close()
-            conn.close()
-            # Already enrolled - redirect back with a simple flash message later; for now just redirect
-            return redirect(url_for('student_course_info'))
-
-        # 2) Check capacity
-        cur.execute("SELECT capacity FROM Section WHERE sectionID=%s", (section_id,))
-        row = cur.fetchone()
-        capacity = row['capacity'] if row else None
+    outcome = register_student(student_id, section_id)
+    if outcome != REGISTERED:
+        return redirect(url_for('student_course_info', message=REGISTRATION_MESSAGES[outcome]))
 
-        cur.execute("SELECT COUNT(*) AS cnt FROM Enrollment WHERE sectionID=%s AND status='enrolled'", (section_id,))
-        cnt_row = cur.fetchone()
-        enrolled_count = cnt_row['cnt'] if cnt_row else 0
+    return redirect(url_for('student_courses'))
 
-        if capacity is not None and enrolled_count >= capacity:
-            cur.close()
-            conn.close()
-            # Section full
-            return redirect(url_for('student_course_info'))
 
-        # 3) Insert enrollment
-        cur.execute("INSERT INTO Enrollment (studentID, sectionID, grade, status) VALUES (%s,%s,'TBD','enrolled')", (student_id, section_id))
+@app.cli.command('stress-register')
+@click.argument('section_id', type=int)
+@click.option('--students', default=300, help='Number of distinct students to register concurrently.')
+@click.option('--workers', default=50, help='Concurrent registration threads.')
+@click.option('--keep', is_flag=True, help='Keep the enrollments created by the run.')
+def stress_register_command(section_id, students, workers, keep):
+    """
+    Fire concurrent registrations at one section and check it is never overbooked.
+    Without --keep the test enrollments are deleted afterwards, but the department headcount
+    sketches they were added to stay inflated until `flask rebuild-headcount-sketches` runs.
+    """
+    conn = db.get_db_connection()
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT st.studentID FROM Student st
+        WHERE NOT EXISTS (SELECT 1 FROM Enrollment e WHERE e.studentID = st.studentID AND e.sectionID = %s)
+        LIMIT %s
+    """, (section_id, students))
+    student_ids = [r[0] for r in cur.fetchall()]
+    if not student_ids:
+        raise click.ClickException("no students without an enrollment in that section")
+
+    def attempt(student_id):
+        try:
+            return register_student(student_id, section_id)
+        except Exception as e:
+            return f"error: {type(e).__name__}"
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        outcomes = Counter(ex.map(attempt, student_ids))
+    elapsed = time.perf_counter() - started
+
+    # end the snapshot opened by the first SELECT so the check sees the registrations
+    conn.rollback()
+    cur.execute("""
+        SELECT s.capacity, s.enrolled_count,
+               (SELECT COUNT(*) FROM Enrollment e WHERE e.sectionID = s.sectionID AND e.status = 'enrolled')
+        FROM Section s WHERE s.sectionID = %s
+    """, (section_id,))
+    capacity, counter, actual = cur.fetchone()
+
+    click.echo(f"{len(student_ids)} registrations in {elapsed:.2f}s ({len(student_ids) / elapsed:.0f}/s) with {workers} workers")
+    for outcome, n in sorted(outcomes.items()):
+        click.echo(f"  {outcome}: {n}")
+    click.echo(f"capacity {capacity}, enrolled {actual}, counter {counter}")
+
+    if not keep:
+        pages = find_section_pages(cur, "sectionID = %s", (section_id,))
+        placeholders = ','.join(['%s'] * len(student_ids))
+        cur.execute(f"DELETE FROM Enrollment WHERE sectionID = %s AND studentID IN ({placeholders})",
+                    (section_id, *student_ids))
+        cur.execute("""
+            UPDATE Section SET enrolled_count =
+              (SELECT COUNT(*) FROM Enrollment e WHERE e.sectionID = %s AND e.status = 'enrolled')
+            WHERE sectionID = %s
+        """, (section_id, section_id))
         conn.commit()
-    finally:
-        cur.close()
-        conn.close()
-
-    return redirect(url_for('student_courses'))
+        invalidate_reports('enrollments')
+        forget_students(student_ids)
+        bump_pages(pages)
+        def drop_timetables():
+            for student_id in student_ids:
+                timetable_drop(student_id, section_id)
+        db.after_commit(drop_timetables)
+    cur.close()
+
+    if actual > capacity or counter != actual:
+        raise click.ClickException("section was overbooked or its seat counter drifted")
+    errors = sum(n for outcome, n in outcomes.items() if outcome.startswith('error'))
+    if errors:
+        raise click.ClickException(f"{errors} registration(s) failed with an error")
+    click.echo("ok: never overbooked")
 
 
 @app.route('/student/edit', methods=['GET', 'POST'])
@@ -394,7 +903,7 @@ def student_edit():
         return render_template('student/edit_profile.html', student=profile,
                                error="First and last name are required.")
 
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor()
 
@@ -410,7 +919,16 @@ def student_edit():
         params.append(student_id)
         sql = f"UPDATE Student SET {', '.join(sql_parts)} WHERE studentID = %s"
         cur.execute(sql, tuple(params))
+        if new_password:
+            try:
+                sync_identity(conn, cur, 'student', student_id)
+            except EmailInUse as e:
+                return render_template('student/edit_profile.html', student=get_student_profile(student_id),
+                                       error=str(e), user_name=session.get('user_name'))
+        pages = find_section_pages(cur, "sectionID IN (SELECT sectionID FROM Enrollment WHERE studentID = %s)", (student_id,))
         conn.commit()
+        forget_students([student_id], enrollments=False, profile=True)
+        bump_pages(key for key in pages if key[0] == 'roster')
 
         # update session user_name
         session['user_name'] = f"{first_name} {last_name}".strip()
@@ -423,18 +941,19 @@ def student_edit():
 
 # --- Instructor helpers ---
 def get_instructor_sections(instr_id, semester=None, year=None):
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor(dictionary=True)
         sql = """
             SELECT
               s.sectionID, s.semester, s.year, s.capacity,
               c.courseID, c.course_name, c.course_number, c.credits,
-              (SELECT COUNT(*) FROM Enrollment e WHERE e.sectionID = s.sectionID AND e.status='enrolled') AS enrolled_count,
+              s.enrolled_count,
               t.day_of_week, TIME_FORMAT(t.start_time, '%%H:%%i') AS start_time,
               TIME_FORMAT(t.end_time, '%%H:%%i') AS end_time,
               cl.room_number, b.building_name
             FROM Section s
+            JOIN Term tm ON s.termID = tm.termID
             JOIN Course c ON s.courseID = c.courseID
             LEFT JOIN Timeslot t ON s.timeslotID = t.timeslotID
             LEFT JOIN Classroom cl ON s.classroomID = cl.classroomID
@@ -443,21 +962,36 @@ def get_instructor_sections(instr_id, semester=None, year=None):
         """
         params = [instr_id]
         if semester:
-            sql += " AND s.semester = %s"
+            sql += " AND tm.semester = %s"
             params.append(semester)
         if year:
-            sql += " AND s.year = %s"
+            sql += " AND tm.year = %s"
             params.append(year)
-        sql += " ORDER BY s.year DESC, s.semester DESC, c.course_number"
+        sql += " ORDER BY tm.ordinal DESC, c.course_number"
         cur.execute(sql, tuple(params))
         return cur.fetchall()
     finally:
         cur.close()
         conn.close()
 
+def get_instructor_section(section_id, instr_id):
+    """Return basic info for a section taught by instr_id, or None if it is not theirs."""
+    conn = db.get_db_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        cur.execute("""
+          SELECT s.sectionID, s.semester, s.year, s.capacity, c.courseID, c.course_number, c.course_name
+          FROM Section s JOIN Course c ON s.courseID = c.courseID
+          WHERE s.sectionID = %s AND s.instructorID = %s
+        """, (section_id, instr_id))
+        return cur.fetchone()
+    finally:
+        cur.close()
+        conn.close()
+
 def get_section_roster(section_id):
     """Return roster for a section with enrollment info."""
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor(dictionary=True)
         cur.execute("""
@@ -477,77 +1011,286 @@ def get_section_roster(section_id):
 
 
 # --- Instructor routes ---
-# Grade mapping used in SQL CASE (update to your institution mapping if needed)
-GRADE_CASE_SQL = """
-  CASE
-    WHEN e.grade = 'A' THEN 4.0
-    WHEN e.grade = 'A-' THEN 3.7
-    WHEN e.grade = 'B+' THEN 3.3
-    WHEN e.grade = 'B' THEN 3.0
-    WHEN e.grade = 'B-' THEN 2.7
-    WHEN e.grade = 'C+' THEN 2.3
-    WHEN e.grade = 'C' THEN 2.0
-    WHEN e.grade = 'C-' THEN 1.7
-    WHEN e.grade = 'D+' THEN 1.3
-    WHEN e.grade = 'D' THEN 1.0
-    WHEN e.grade = 'F' THEN 0.0
-    ELSE NULL
-  END
+# Letter grade -> grade points lives in the GradeScale table (see migrations.py); every grade
+# write also stores Enrollment.grade_points so reports aggregate a numeric column directly.
+UNGRADED = 'TBD'
+
+def get_grade_scale():
+    """Return {letter grade: points} from GradeScale."""
+    conn = db.get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT grade, points FROM GradeScale")
+        return dict(cur.fetchall())
+    finally:
+        cur.close()
+        conn.close()
+
+# Report aggregates: GradeSummaryCourse / GradeSummaryDepartment hold graded_count and points_sum
+# per term. Grade writes apply deltas on the same cursor; rebuild_grade_summaries recomputes them.
+SUMMARY_UPSERT = """
+    ON DUPLICATE KEY UPDATE graded_count = graded_count + VALUES(graded_count),
+                            points_sum = points_sum + VALUES(points_sum)
 """
 
-def set_enrollment_grade(enrollment_id, grade):
-    conn = config.get_db_connection()
+def grade_delta(old_points, new_points):
+    """(graded_count, points_sum) change when an enrollment's grade points go from old to new."""
+    count = (new_points is not None) - (old_points is not None)
+    return count, (new_points or 0) - (old_points or 0)
+
+def apply_grade_summary_delta(cur, section_id, count, points):
+    """Add a grade delta for one section to its course and department summaries."""
+    if not count and not points:
+        return
+    cur.execute("""
+        INSERT INTO GradeSummaryCourse (courseID, semester, year, graded_count, points_sum)
+        SELECT s.courseID, s.semester, s.year, %s, %s FROM Section s WHERE s.sectionID = %s
+    """ + SUMMARY_UPSERT, (count, points, section_id))
+    cur.execute("""
+        INSERT INTO GradeSummaryDepartment (departmentID, semester, year, graded_count, points_sum)
+        SELECT c.departmentID, s.semester, s.year, %s, %s
+        FROM Section s JOIN Course c ON c.courseID = s.courseID WHERE s.sectionID = %s
+    """ + SUMMARY_UPSERT, (count, points, section_id))
+
+def shift_grade_summaries(cur, where_sql, params, sign):
+    """
+    Add (sign=1) or remove (sign=-1) the graded enrollments matched by `where_sql` (over e, s, c)
+    from the summaries. Used around deletes and section/course moves that re-home grades.
+    """
+    cur.execute(f"""
+        INSERT INTO GradeSummaryCourse (courseID, semester, year, graded_count, points_sum)
+        SELECT s.courseID, s.semester, s.year, %s * COUNT(*), %s * SUM(e.grade_points)
+        FROM Enrollment e JOIN Section s ON s.sectionID = e.sectionID JOIN Course c ON c.courseID = s.courseID
+        WHERE e.grade_points IS NOT NULL AND {where_sql}
+        GROUP BY s.courseID, s.semester, s.year
+    """ + SUMMARY_UPSERT, (sign, sign, *params))
+    cur.execute(f"""
+        INSERT INTO GradeSummaryDepartment (departmentID, semester, year, graded_count, points_sum)
+        SELECT c.departmentID, s.semester, s.year, %s * COUNT(*), %s * SUM(e.grade_points)
+        FROM Enrollment e JOIN Section s ON s.sectionID = e.sectionID JOIN Course c ON c.courseID = s.courseID
+        WHERE e.grade_points IS NOT NULL AND {where_sql}
+        GROUP BY c.departmentID, s.semester, s.year
+    """ + SUMMARY_UPSERT, (sign, sign, *params))
+
+def rebuild_grade_summaries():
+    """
+    Re-derive Enrollment.grade_points from GradeScale (so an edited scale takes effect), then
+    recompute both summary tables from Enrollment, in one transaction.
+    """
+    conn = db.get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE Enrollment e LEFT JOIN GradeScale gs ON gs.grade = e.grade
+            SET e.grade_points = gs.points
+        """)
+        cur.execute("DELETE FROM GradeSummaryCourse")
+        cur.execute("DELETE FROM GradeSummaryDepartment")
+        shift_grade_summaries(cur, "1=1", (), 1)
+        conn.commit()
+        invalidate_reports()
+    finally:
+        cur.close()
+        conn.close()
+
+@app.cli.command('rebuild-report-summaries')
+def rebuild_report_summaries_command():
+    """Re-apply GradeScale to stored grade points and recompute the per-term grade summaries."""
+    rebuild_grade_summaries()
+    click.echo("grade summaries rebuilt")
+
+def set_section_grades(section_id, grades):
+    """
+    Write a section's grade sheet with one locking read, one UPDATE and one commit.
+    `grades` maps enrollmentID -> grade. Returns one dict per posted row with keys
+    enrollmentID, grade and result ('updated', 'unchanged', 'invalid_grade' or 'not_in_section').
+    """
+    scale = get_grade_scale()
+    results = []
+    valid = {}
+    for enrollment_id, grade in grades.items():
+        grade = (grade or '').strip().upper()
+        try:
+            enrollment_id = int(enrollment_id)
+        except (TypeError, ValueError):
+            results.append({'enrollmentID': enrollment_id, 'grade': grade, 'result': 'not_in_section'})
+            continue
+        if grade not in scale and grade != UNGRADED:
+            results.append({'enrollmentID': enrollment_id, 'grade': grade, 'result': 'invalid_grade'})
+            continue
+        valid[enrollment_id] = grade
+    if not valid:
+        return results
+
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor()
-        cur.execute("UPDATE Enrollment SET grade = %s WHERE enrollmentID = %s", (grade, enrollment_id))
+        ids = list(valid)
+        placeholders = ','.join(['%s'] * len(ids))
+        cur.execute(f"SELECT enrollmentID, grade, grade_points, studentID FROM Enrollment WHERE sectionID = %s AND enrollmentID IN ({placeholders}) FOR UPDATE",
+                    (section_id, *ids))
+        current = {}
+        old_points = {}
+        students = {}
+        for enrollment_id, grade, points, student_id in cur.fetchall():
+            current[enrollment_id] = grade
+            old_points[enrollment_id] = points
+            students[enrollment_id] = student_id
+
+        changed = []
+        for enrollment_id, grade in valid.items():
+            if enrollment_id not in current:
+                result = 'not_in_section'
+            elif current[enrollment_id] == grade:
+                result = 'unchanged'
+            else:
+                result = 'updated'
+                changed.append(enrollment_id)
+            results.append({'enrollmentID': enrollment_id, 'grade': grade, 'result': result})
+
+        if changed:
+            cases = ' '.join(['WHEN %s THEN %s'] * len(changed))
+            grade_params = [v for eid in changed for v in (eid, valid[eid])]
+            point_params = [v for eid in changed for v in (eid, scale.get(valid[eid]))]
+            placeholders = ','.join(['%s'] * len(changed))
+            cur.execute(f"UPDATE Enrollment SET grade = CASE enrollmentID {cases} END, "
+                        f"grade_points = CASE enrollmentID {cases} END "
+                        f"WHERE sectionID = %s AND enrollmentID IN ({placeholders})",
+                        (*grade_params, *point_params, section_id, *changed))
+            count_delta = points_delta = 0
+            for eid in changed:
+                count, points = grade_delta(old_points[eid], scale.get(valid[eid]))
+                count_delta += count
+                points_delta += points
+            apply_grade_summary_delta(cur, section_id, count_delta, points_delta)
+            ordinal = section_term_ordinal(cur, section_id)
         conn.commit()
+        if changed:
+            invalidate_reports('grades', ordinal)
+            forget_students({students[eid] for eid in changed})
+            bump_pages([('roster', int(section_id))])
+        return results
     finally:
         cur.close()
         conn.close()
 
+def posted_grades(form):
+    """Collect the non-empty grade_<enrollmentID> fields of a roster form."""
+    return {key.split('_', 1)[1]: value for key, value in form.items()
+            if key.startswith('grade_') and value.strip()}
+
+def summarize_grade_results(results):
+    counts = Counter(r['result'] for r in results)
+    problems = [r for r in results if r['result'] not in ('updated', 'unchanged')]
+    return {'counts': counts, 'problems': problems}
+
 def remove_student_from_enrollment(enrollment_id):
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor()
+        cur.execute("SELECT studentID, sectionID FROM Enrollment WHERE enrollmentID = %s", (enrollment_id,))
+        row = cur.fetchone()
+        if not row:
+            return
         # You may choose to delete or mark dropped. We'll set status='dropped' for safety
+        pages = find_section_pages(cur, "sectionID = %s", (row[1],))
+        release_seat(cur, enrollment_id)
         cur.execute("UPDATE Enrollment SET status = 'dropped' WHERE enrollmentID = %s", (enrollment_id,))
         conn.commit()
+        invalidate_reports('enrollments')
+        forget_students([row[0]])
+        bump_pages(pages)
+        db.after_commit(lambda: timetable_drop(row[0], row[1]))
     finally:
         cur.close()
         conn.close()
 
 def assign_advisor_to_student(student_id, advisor_id):
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor()
         cur.execute("UPDATE Student SET advisorID = %s WHERE studentID = %s", (advisor_id, student_id))
         conn.commit()
+        forget_students([student_id], enrollments=False, profile=True)
     finally:
         cur.close()
         conn.close()
 
+# Prerequisites: prereqs.PrereqGraph (adjacency + transitive closure) loaded from
+# CoursePrerequisite, updated edge by edge after add/remove commits, and reloaded once it is
+# REFERENCE_CACHE_MAX_AGE seconds old so other processes' edits show up.
+prereq_graph_cache = BoundedCache(maxsize=1, ttl=getattr(config, 'REFERENCE_CACHE_MAX_AGE', 300))
+
+def get_prereq_graph():
+    graph = prereq_graph_cache.get('graph', None)
+    if graph is None:
+        conn = db.get_db_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT courseID, prereqCourseID FROM CoursePrerequisite")
+            graph = prereqs.PrereqGraph(cur.fetchall())
+        finally:
+            cur.close()
+            conn.close()
+        prereq_graph_cache.set('graph', graph)
+    return graph
+
 def add_course_prereq(course_id, prereq_id):
-    conn = config.get_db_connection()
+    """
+    Add a prerequisite; raises prereqs.PrerequisiteCycle if the course would end up requiring itself.
+    The cached graph gives a quick answer, then the check is repeated against the table read with
+    FOR UPDATE: concurrent adds (from any process) queue on those locks and see each other's rows,
+    so two of them can't each close half of a cycle.
+    """
+    course_id, prereq_id = int(course_id), int(prereq_id)
+    cycle = prereqs.PrerequisiteCycle(f"course {prereq_id} already requires course {course_id}")
+    if get_prereq_graph().would_cycle(course_id, prereq_id):
+        raise cycle
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor()
+        cur.execute("SELECT courseID, prereqCourseID FROM CoursePrerequisite FOR UPDATE")
+        graph = prereqs.PrereqGraph(cur.fetchall())
+        if graph.would_cycle(course_id, prereq_id):
+            conn.rollback()
+            raise cycle
         cur.execute("INSERT IGNORE INTO CoursePrerequisite (courseID, prereqCourseID) VALUES (%s, %s)", (course_id, prereq_id))
+        graph.add(course_id, prereq_id)
         conn.commit()
+        db.after_commit(lambda: prereq_graph_cache.set('graph', graph))
     finally:
         cur.close()
         conn.close()
 
 def remove_course_prereq(course_id, prereq_id):
-    conn = config.get_db_connection()
+    course_id, prereq_id = int(course_id), int(prereq_id)
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor()
         cur.execute("DELETE FROM CoursePrerequisite WHERE courseID=%s AND prereqCourseID=%s", (course_id, prereq_id))
         conn.commit()
+        db.after_commit(lambda: forget_prereq(course_id, prereq_id))
     finally:
         cur.close()
         conn.close()
 
-def get_all_courses():
-    conn = config.get_db_connection()
+def forget_prereq(course_id, prereq_id):
+    """Apply a committed removal to whichever graph is cached now."""
+    graph = prereq_graph_cache.get('graph', None)
+    if graph is not None:
+        graph.remove(course_id, prereq_id)
+
+def get_completed_courses(cur, student_id):
+    """IDs of courses the student has completed with a passing grade (caller's dictionary cursor)."""
+    cur.execute("""
+        SELECT DISTINCT s.courseID
+        FROM Enrollment e JOIN Section s ON s.sectionID = e.sectionID
+        WHERE e.studentID = %s AND e.status = 'completed' AND COALESCE(e.grade_points, 1) > 0
+    """, (student_id,))
+    return {r['courseID'] for r in cur.fetchall()}
+
+def load_courses():
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor(dictionary=True)
         cur.execute("SELECT courseID, course_number, course_name FROM Course ORDER BY course_number")
@@ -556,8 +1299,25 @@ def get_all_courses():
         cur.close()
         conn.close()
 
-def get_all_departments():
-    conn = config.get_db_connection()
+reference_data.register('courses', load_courses)
+
+def get_all_courses():
+    return reference_data.get('courses')
+
+# Course search: search.CourseIndex built from the 'courses' reference snapshot and rebuilt
+# whenever that snapshot is replaced (course create/update/delete, or max age).
+course_index_cache = BoundedCache(maxsize=1)
+
+def get_course_index():
+    courses = get_all_courses()
+    entry = course_index_cache.get('index', None)
+    if entry is None or entry[0] is not courses:
+        entry = (courses, search.CourseIndex(courses))
+        course_index_cache.set('index', entry)
+    return entry[1]
+
+def load_departments():
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor(dictionary=True)
         cur.execute("SELECT departmentID, department_name FROM Department ORDER BY department_name")
@@ -566,42 +1326,110 @@ def get_all_departments():
         cur.close()
         conn.close()
 
-def get_course_prereqs():
-    conn = config.get_db_connection()
+reference_data.register('departments', load_departments)
+
+def get_all_departments():
+    return reference_data.get('departments')
+
+def load_buildings():
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor(dictionary=True)
-        cur.execute("""
-          SELECT cp.courseID, cp.prereqCourseID,
-                 c.course_number, c.course_name,
-                 p.course_number AS prereq_number, p.course_name AS prereq_name
-          FROM CoursePrerequisite cp
-          JOIN Course c ON cp.courseID = c.courseID
-          JOIN Course p ON cp.prereqCourseID = p.courseID
-          ORDER BY c.course_number
-        """)
+        cur.execute("SELECT buildingID, building_name FROM Building ORDER BY building_name")
         return cur.fetchall()
     finally:
         cur.close()
         conn.close()
 
+reference_data.register('buildings', load_buildings)
+
+def get_all_buildings():
+    return reference_data.get('buildings')
+
+def get_course_prereqs():
+    """Every (course, prerequisite) pair with course numbers and names, from the prerequisite graph."""
+    courses = {c['courseID']: c for c in get_all_courses()}
+    rows = []
+    for course_id, prereq_id in get_prereq_graph().pairs():
+        c, p = courses.get(course_id), courses.get(prereq_id)
+        if c and p:
+            rows.append({'courseID': course_id, 'prereqCourseID': prereq_id,
+                         'course_number': c['course_number'], 'course_name': c['course_name'],
+                         'prereq_number': p['course_number'], 'prereq_name': p['course_name']})
+    rows.sort(key=lambda r: (r['course_number'], r['prereq_number']))
+    return rows
+
 # Reports / analytics helpers
+# Results are cached in report_cache keyed by report name and arguments. Writers call
+# invalidate_reports() once committed: grade changes for the section's term, enrollment changes
+# for 'enrollments', and structural edits (sections, courses, departments) drop everything.
+report_cache = ReportCache(maxsize=getattr(config, 'REPORT_CACHE_SIZE', 512),
+                           ttl=getattr(config, 'REPORT_CACHE_TTL', 300),
+                           closed_ttl=getattr(config, 'REPORT_CACHE_CLOSED_TTL', 3600))
+current_term_cache = BoundedCache(maxsize=2, ttl=60)
+
+def current_term_ordinal():
+    ordinal = current_term_cache.get('ordinal', None)
+    if ordinal is None:
+        term = get_current_term()
+        ordinal = term['ordinal'] if term else 0
+        current_term_cache.set('ordinal', ordinal)
+    return ordinal
+
+def report_term_range(from_sem=None, from_year=None, to_sem=None, to_year=None):
+    """(low, high) Term.ordinal bounds of a report range; None for an open end."""
+    low = term_ordinal(from_sem, from_year, 1) if from_year else None
+    high = term_ordinal(to_sem, to_year, 3) if to_year else None
+    return low, high
+
+def section_term_ordinal(cur, section_id):
+    cur.execute("SELECT t.ordinal FROM Section s JOIN Term t ON t.termID = s.termID WHERE s.sectionID = %s", (section_id,))
+    row = cur.fetchone()
+    if not row:
+        return None
+    return row['ordinal'] if isinstance(row, dict) else row[0]
+
+def invalidate_reports(source=None, ordinal=None):
+    """Drop cached reports built from `source` ('grades' / 'enrollments', None = all) after commit."""
+    db.after_commit(lambda: report_cache.invalidate(source, ordinal))
 
+def cached_report(*sources):
+    """
+    Serve a report helper from report_cache. The key is the helper name plus its bound arguments;
+    from_sem/from_year/to_sem/to_year give the term range the entry depends on, and a range that
+    ended before the current term is kept for REPORT_CACHE_CLOSED_TTL instead of REPORT_CACHE_TTL.
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            params = bound.arguments
+            low, high = report_term_range(params.get('from_sem'), params.get('from_year'),
+                                          params.get('to_sem'), params.get('to_year'))
+            closed = high is not None and high < current_term_ordinal()
+            key = (fn.__name__,) + tuple((name, tuple(v) if isinstance(v, list) else v) for name, v in params.items())
+            return report_cache.get_or_compute(key, lambda: fn(*args, **kwargs), sources, low, high, closed)
+        return wrapper
+    return decorator
+
+@cached_report('grades')
 def avg_grade_by_department(dept_id=None):
     """
     Return list of departments with average numeric GPA (based on enrollments for courses in that dept).
     If dept_id provided, filter to that department.
     """
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor(dictionary=True)
-        sql = f"""
+        sql = """
           SELECT d.departmentID, d.department_name,
-                 AVG({GRADE_CASE_SQL}) AS avg_gpa
-          FROM Enrollment e
-          JOIN Section s ON e.sectionID = s.sectionID
-          JOIN Course c ON s.courseID = c.courseID
-          JOIN Department d ON c.departmentID = d.departmentID
-          WHERE e.grade IS NOT NULL AND e.grade NOT IN ('TBD', '')
+                 SUM(g.points_sum) / SUM(g.graded_count) AS avg_gpa
+          FROM GradeSummaryDepartment g
+          JOIN Department d ON g.departmentID = d.departmentID
+          WHERE g.graded_count > 0
         """
         params = []
         if dept_id:
@@ -614,43 +1442,29 @@ def avg_grade_by_department(dept_id=None):
         cur.close()
         conn.close()
 
+@cached_report('grades')
 def avg_grade_for_course_range(course_id, from_sem=None, from_year=None, to_sem=None, to_year=None):
     """
     Compute average numeric GPA for a course across a range. Semesters are strings like 'Fall'.
-    Range filtering: we compare (year, semester) lexicographically — convert semester to ordering index.
-    We'll use CASE to convert semester to a number (Spring=1, Summer=2, Fall=3).
+    A missing semester means the start (Spring) of from_year or the end (Fall) of to_year;
+    the bounds are compared against Term.ordinal.
     """
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor(dictionary=True)
-        sem_order_case = """
-          CASE WHEN s.semester='Spring' THEN 1 WHEN s.semester='Summer' THEN 2 WHEN s.semester='Fall' THEN 3 ELSE 4 END
-        """
-        # build WHERE for course
-        sql = f"""
-          SELECT AVG({GRADE_CASE_SQL}) AS avg_gpa
-          FROM Enrollment e
-          JOIN Section s ON e.sectionID = s.sectionID
-          WHERE s.courseID = %s
-            AND e.grade IS NOT NULL AND e.grade NOT IN ('TBD','')
+        sql = """
+          SELECT SUM(g.points_sum) / NULLIF(SUM(g.graded_count), 0) AS avg_gpa
+          FROM GradeSummaryCourse g
+          JOIN Term t ON t.semester = g.semester AND t.year = g.year
+          WHERE g.courseID = %s
         """
         params = [course_id]
-        # If from/to range provided, add composite comparisons
-        # We'll translate (year, sem_order) to numbers: year * 10 + sem_order
-        if from_year or to_year or from_sem or to_sem:
-            def comp_value(year_field, sem_field):
-                return f"(s.year * 10 + {sem_order_case})"
-            # build low bound
-            if from_year:
-                from_sem_ord = {"Spring":1,"Summer":2,"Fall":3}.get(from_sem,1)
-                low = int(from_year) * 10 + int(from_sem_ord)
-                sql += f" AND ({comp_value('s.year','s.semester')}) >= %s"
-                params.append(low)
-            if to_year:
-                to_sem_ord = {"Spring":1,"Summer":2,"Fall":3}.get(to_sem,3)
-                high = int(to_year) * 10 + int(to_sem_ord)
-                sql += f" AND ({comp_value('s.year','s.semester')}) <= %s"
-                params.append(high)
+        if from_year:
+            sql += " AND t.ordinal >= %s"
+            params.append(term_ordinal(from_sem, from_year, 1))
+        if to_year:
+            sql += " AND t.ordinal <= %s"
+            params.append(term_ordinal(to_sem, to_year, 3))
         cur.execute(sql, tuple(params))
         row = cur.fetchone()
         return row
@@ -658,76 +1472,212 @@ def avg_grade_for_course_range(course_id, from_sem=None, from_year=None, to_sem=
         cur.close()
         conn.close()
 
-def best_and_worst_classes(semester, year, top_n=5):
-    conn = config.get_db_connection()
+@cached_report('grades')
+def rank_courses(from_sem=None, from_year=None, to_sem=None, to_year=None, dept_id=None, top_n=5, min_graded=1):
+    """
+    Rank courses by average GPA over a term range (any bound may be omitted) with one grouped
+    query over GradeSummaryCourse. Returns {'top', 'bottom', 'courses'}: every course with at
+    least `min_graded` graded enrollments gets 'rank' (1 = best), 'percentile' (0-100, share of
+    ranked courses it beats) and 'graded_count'; top/bottom are the first/last `top_n` of that list.
+    """
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor(dictionary=True)
-        sql = f"""
-          SELECT c.courseID, c.course_number, c.course_name, AVG({GRADE_CASE_SQL}) AS avg_gpa
-          FROM Enrollment e
-          JOIN Section s ON e.sectionID = s.sectionID
-          JOIN Course c ON s.courseID = c.courseID
-          WHERE s.semester = %s AND s.year = %s AND e.grade IS NOT NULL AND e.grade NOT IN ('TBD','')
-          GROUP BY c.courseID, c.course_number, c.course_name
-          HAVING COUNT(e.enrollmentID) > 0
-          ORDER BY avg_gpa DESC
-          LIMIT %s
+        sql = """
+          SELECT c.courseID, c.course_number, c.course_name, c.departmentID,
+                 SUM(g.graded_count) AS graded_count,
+                 SUM(g.points_sum) / SUM(g.graded_count) AS avg_gpa
+          FROM GradeSummaryCourse g
+          JOIN Term t ON t.semester = g.semester AND t.year = g.year
+          JOIN Course c ON g.courseID = c.courseID
+          WHERE g.graded_count > 0
         """
-        cur.execute(sql, (semester, year, top_n))
-        top = cur.fetchall()
-
-        sql_low = f"""
-          SELECT c.courseID, c.course_number, c.course_name, AVG({GRADE_CASE_SQL}) AS avg_gpa
-          FROM Enrollment e
-          JOIN Section s ON e.sectionID = s.sectionID
-          JOIN Course c ON s.courseID = c.courseID
-          WHERE s.semester = %s AND s.year = %s AND e.grade IS NOT NULL AND e.grade NOT IN ('TBD','')
-          GROUP BY c.courseID, c.course_number, c.course_name
-          HAVING COUNT(e.enrollmentID) > 0
-          ORDER BY avg_gpa ASC
-          LIMIT %s
+        params = []
+        if dept_id:
+            sql += " AND c.departmentID = %s"
+            params.append(dept_id)
+        if from_year:
+            sql += " AND t.ordinal >= %s"
+            params.append(term_ordinal(from_sem, from_year, 1))
+        if to_year:
+            sql += " AND t.ordinal <= %s"
+            params.append(term_ordinal(to_sem, to_year, 3))
+        sql += """
+          GROUP BY c.courseID, c.course_number, c.course_name, c.departmentID
+          HAVING SUM(g.graded_count) >= %s
+          ORDER BY avg_gpa DESC, c.course_number
         """
-        cur.execute(sql_low, (semester, year, top_n))
-        bottom = cur.fetchall()
+        params.append(max(int(min_graded), 1))
+        cur.execute(sql, tuple(params))
+        courses = cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
 
-        return {"top": top, "bottom": bottom}
+    top_n = max(int(top_n), 0)
+    total = len(courses)
+    for i, row in enumerate(courses):
+        row['rank'] = i + 1
+        row['percentile'] = round(100.0 * (total - 1 - i) / (total - 1), 1) if total > 1 else 100.0
+    return {
+        "top": courses[:top_n],
+        "bottom": list(reversed(courses[-top_n:])) if top_n > 0 else [],
+        "courses": courses,
+    }
+
+def best_and_worst_classes(semester, year, top_n=5, dept_id=None, min_graded=1):
+    return rank_courses(semester, year, semester, year, dept_id=dept_id, top_n=top_n, min_graded=min_graded)
+
+@cached_report('grades')
+def course_term_trends(course_ids=None, dept_id=None, from_sem=None, from_year=None, to_sem=None, to_year=None):
+    """
+    Course x term matrix of average GPA and graded counts for a set of courses (or a whole
+    department) over a term range, read with one query from GradeSummaryCourse.
+    Returns {'terms': [...oldest first], 'rows': [{courseID, course_number, course_name, 'cells': [...]}]}
+    where cells line up with terms and hold {'avg_gpa', 'graded_count'} or None.
+    """
+    if not course_ids and not dept_id:
+        return {'terms': [], 'rows': []}
+    conn = db.get_db_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        sql = """
+          SELECT c.courseID, c.course_number, c.course_name, t.semester, t.year, t.ordinal,
+                 g.graded_count, g.points_sum / g.graded_count AS avg_gpa
+          FROM GradeSummaryCourse g
+          JOIN Term t ON t.semester = g.semester AND t.year = g.year
+          JOIN Course c ON g.courseID = c.courseID
+          WHERE g.graded_count > 0
+        """
+        params = []
+        if course_ids:
+            sql += f" AND c.courseID IN ({','.join(['%s'] * len(course_ids))})"
+            params.extend(course_ids)
+        if dept_id:
+            sql += " AND c.departmentID = %s"
+            params.append(dept_id)
+        if from_year:
+            sql += " AND t.ordinal >= %s"
+            params.append(term_ordinal(from_sem, from_year, 1))
+        if to_year:
+            sql += " AND t.ordinal <= %s"
+            params.append(term_ordinal(to_sem, to_year, 3))
+        sql += " ORDER BY c.course_number, t.ordinal"
+        cur.execute(sql, tuple(params))
+        cells = cur.fetchall()
     finally:
         cur.close()
         conn.close()
 
-def student_counts_by_department():
+    terms = {}
+    rows = {}
+    for r in cells:
+        terms[r['ordinal']] = {'semester': r['semester'], 'year': r['year'], 'ordinal': r['ordinal']}
+        row = rows.setdefault(r['courseID'], {'courseID': r['courseID'], 'course_number': r['course_number'],
+                                              'course_name': r['course_name'], 'by_term': {}})
+        row['by_term'][r['ordinal']] = {'avg_gpa': r['avg_gpa'], 'graded_count': r['graded_count']}
+    ordinals = sorted(terms)
+    for row in rows.values():
+        row['cells'] = [row['by_term'].get(o) for o in ordinals]
+        del row['by_term']
+    return {'terms': [terms[o] for o in ordinals], 'rows': list(rows.values())}
+
+def trends_csv(trends):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    header = ['course_number', 'course_name']
+    for t in trends['terms']:
+        header += [f"{t['semester']} {t['year']} avg_gpa", f"{t['semester']} {t['year']} graded"]
+    writer.writerow(header)
+    for row in trends['rows']:
+        line = [row['course_number'], row['course_name']]
+        for cell in row['cells']:
+            line += [f"{cell['avg_gpa']:.3f}", cell['graded_count']] if cell else ['', '']
+        writer.writerow(line)
+    return out.getvalue()
+
+@cached_report('enrollments')
+def student_counts_by_department(approximate=False):
     """
     Returns list of departments with:
       - total_students: distinct students who have EVER enrolled in any course in that department
       - current_students: distinct students currently enrolled in enrolled status in that department
+    Both come from one grouped pass over Enrollment.
+    approximate=True reads no Enrollment rows at all:
+      - total_students is estimated from the department's HyperLogLog sketch (relative error about
+        hll.STANDARD_ERROR). The sketch only grows: register_student adds each new enrollment, but
+        deleted students, deleted enrollments and stress-register cleanups are never subtracted,
+        so the estimate can run high until `flask rebuild-headcount-sketches`.
+      - current_students sums Section.enrolled_count, i.e. enrolled seats: a student in two
+        sections of the department counts twice.
     """
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor(dictionary=True)
-        sql = """
-          SELECT d.departmentID, d.department_name,
-            (SELECT COUNT(DISTINCT e2.studentID)
-             FROM Enrollment e2
-             JOIN Section s2 ON e2.sectionID = s2.sectionID
-             JOIN Course c2 ON s2.courseID = c2.courseID
-             WHERE c2.departmentID = d.departmentID) AS total_students,
-            (SELECT COUNT(DISTINCT e3.studentID)
-             FROM Enrollment e3
-             JOIN Section s3 ON e3.sectionID = s3.sectionID
-             JOIN Course c3 ON s3.courseID = c3.courseID
-             WHERE c3.departmentID = d.departmentID AND e3.status = 'enrolled') AS current_students
+        if not approximate:
+            cur.execute("""
+              SELECT d.departmentID, d.department_name,
+                     COUNT(DISTINCT e.studentID) AS total_students,
+                     COUNT(DISTINCT CASE WHEN e.status = 'enrolled' THEN e.studentID END) AS current_students
+              FROM Department d
+              LEFT JOIN Course c ON c.departmentID = d.departmentID
+              LEFT JOIN Section s ON s.courseID = c.courseID
+              LEFT JOIN Enrollment e ON e.sectionID = s.sectionID
+              GROUP BY d.departmentID, d.department_name
+              ORDER BY d.department_name
+            """)
+            return cur.fetchall()
+        cur.execute("""
+          SELECT d.departmentID, d.department_name, COALESCE(SUM(s.enrolled_count), 0) AS current_students
           FROM Department d
+          LEFT JOIN Course c ON c.departmentID = d.departmentID
+          LEFT JOIN Section s ON s.courseID = c.courseID
+          GROUP BY d.departmentID, d.department_name
           ORDER BY d.department_name
-        """
-        cur.execute(sql)
-        return cur.fetchall()
+        """)
+        rows = cur.fetchall()
+        cur.execute("SELECT departmentID, bucket, registers FROM DepartmentHeadcountSketch")
+        sketches = {}
+        for r in cur.fetchall():
+            sketches.setdefault(r['departmentID'], hll.HyperLogLog()).set_bucket(r['bucket'], r['registers'])
+        for row in rows:
+            sketch = sketches.get(row['departmentID'])
+            row['total_students'] = sketch.count() if sketch else 0
+        return rows
     finally:
         cur.close()
         conn.close()
 
+def record_department_headcount(cur, section_id, student_id):
+    """Add a new enrollment's student to its department's headcount sketch (one register upsert)."""
+    index, rank = hll.register_for(student_id)
+    bucket, pos = hll.bucket_position(index)
+    cur.execute("""
+        INSERT INTO DepartmentHeadcountSketch (departmentID, bucket, registers)
+        SELECT c.departmentID, %s, INSERT(REPEAT(CHAR(0), %s), %s, 1, CHAR(%s))
+        FROM Section s JOIN Course c ON c.courseID = s.courseID
+        WHERE s.sectionID = %s
+        ON DUPLICATE KEY UPDATE registers = INSERT(registers, %s, 1, CHAR(GREATEST(ASCII(SUBSTRING(registers, %s, 1)), %s)))
+    """, (bucket, hll.BUCKET_SIZE, pos, rank, section_id, pos, pos, rank))
+
+@app.cli.command('rebuild-headcount-sketches')
+def rebuild_headcount_sketches_command():
+    """Recompute the per-department HyperLogLog headcount sketches from Enrollment."""
+    conn = db.get_db_connection()
+    cur = conn.cursor()
+    try:
+        hll.rebuild_sketches(cur)
+        conn.commit()
+        invalidate_reports('enrollments')
+    finally:
+        cur.close()
+    click.echo("headcount sketches rebuilt")
+
 # --- Instructor routes ---
 
 @app.route('/instructor/sections')
+@conditional_page(lambda: [('instructor', session['user_id'])] if signed_in_as('instructor') else None,
+                  references=('courses', 'classrooms', 'buildings', 'timeslots'))
 def instructor_sections():
     if 'user_id' not in session or session.get('user_type') != 'instructor':
         return redirect(url_for('index'))
@@ -742,29 +1692,16 @@ def instructor_sections():
                            semester=semester, year=year, q=q)
 
 @app.route('/instructor/section/<int:section_id>/roster', methods=['GET'])
+@conditional_page(lambda section_id: [('roster', section_id)] if signed_in_as('instructor') else None,
+                  references=('courses',))
 def instructor_section_roster(section_id):
     if 'user_id' not in session or session.get('user_type') != 'instructor':
         return redirect(url_for('index'))
 
-    # load section basic info
-    conn = config.get_db_connection()
-    try:
-        cur = conn.cursor(dictionary=True)
-        cur.execute("""
-          SELECT s.sectionID, s.semester, s.year, s.capacity, c.courseID, c.course_number, c.course_name
-          FROM Section s JOIN Course c ON s.courseID = c.courseID
-          WHERE s.sectionID = %s AND s.instructorID = %s
-        """, (section_id, session['user_id']))
-        section = cur.fetchone()
-        if not section:
-            cur.close()
-            conn.close()
-            return redirect(url_for('instructor_sections'))
-
-        roster = get_section_roster(section_id)
-    finally:
-        cur.close()
-        conn.close()
+    section = get_instructor_section(section_id, session['user_id'])
+    if not section:
+        return redirect(url_for('instructor_sections'))
+    roster = get_section_roster(section_id)
 
     return render_template('instructor/section_roster.html', section=section, roster=roster, user_name=session.get('user_name'))
 
@@ -773,19 +1710,14 @@ def instructor_bulk_update_grades(section_id):
     if 'user_id' not in session or session.get('user_type') != 'instructor':
         return redirect(url_for('index'))
 
-    # iterate posted fields; update grade_<enrollmentID>
-    for key, value in request.form.items():
-        if key.startswith('grade_'):
-            enrollment_id = key.split('_', 1)[1]
-            grade = value.strip()
-            if grade:
-                try:
-                    set_enrollment_grade(enrollment_id, grade)
-                except Exception:
-                    # ignore single failures for now
-                    pass
+    section = get_instructor_section(section_id, session['user_id'])
+    if not section:
+        return redirect(url_for('instructor_sections'))
 
-    return redirect(url_for('instructor_section_roster', section_id=section_id))
+    results = set_section_grades(section_id, posted_grades(request.form))
+    roster = get_section_roster(section_id)
+    return render_template('instructor/section_roster.html', section=section, roster=roster,
+                           grade_summary=summarize_grade_results(results), user_name=session.get('user_name'))
 
 @app.route('/instructor/remove-student', methods=['POST'])
 def instructor_remove_student():
@@ -829,13 +1761,16 @@ def instructor_prereqs():
                 add_course_prereq(course_id, prereq_id)
             elif action == 'remove':
                 remove_course_prereq(course_id, prereq_id)
+        except prereqs.PrerequisiteCycle:
+            return redirect(url_for('instructor_prereqs', message="That prerequisite would create a cycle."))
         except Exception:
             pass
         return redirect(url_for('instructor_prereqs'))
 
     courses = get_all_courses()
-    prereqs = get_course_prereqs()
-    return render_template('instructor/prereqs.html', courses=courses, prereqs=prereqs, user_name=session.get('user_name'))
+    course_prereqs = get_course_prereqs()
+    return render_template('instructor/prereqs.html', courses=courses, prereqs=course_prereqs,
+                           message=request.args.get('message'), user_name=session.get('user_name'))
 
 
 @app.route('/instructor/edit', methods=['GET', 'POST'])
@@ -844,7 +1779,7 @@ def instructor_edit():
         return redirect(url_for('index'))
 
     instr_id = session['user_id']
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor(dictionary=True)
 
@@ -911,7 +1846,13 @@ def instructor_edit():
         params.append(instr_id)  # for WHERE clause
         sql = f"UPDATE Instructor SET {', '.join(sql_parts)} WHERE instructorID=%s"
         cur.execute(sql, tuple(params))
+        try:
+            sync_identity(conn, cur, 'instructor', instr_id, email)
+        except EmailInUse as e:
+            return render_template('instructor/edit_profile.html', instr=dict(current, email=email),
+                                   error=str(e), user_name=session.get('user_name'))
         conn.commit()
+        bump_reference('instructors')
 
         # update session user_name
         session['user_name'] = f"{first} {last}".strip()
@@ -932,43 +1873,68 @@ def instructor_reports():
     departments = get_all_departments()
     courses = get_all_courses()
 
-    # possibly controlled by query params
-    department_id = request.args.get('department_id')
+    # possibly controlled by query params; malformed numbers are treated as missing
+    department_id = request.args.get('department_id', type=int)
     report = request.args.get('report')
+    from_year = request.args.get('from_year', type=int)
+    to_year = request.args.get('to_year', type=int)
     context = dict(departments=departments, courses=courses, user_name=session.get('user_name'),
-                   department_id=int(department_id) if department_id else None)
+                   department_id=department_id)
 
     # Average by department (default)
-    if request.args.get('department_id') or not report:
-        dept_filter = int(department_id) if department_id else None
-        context['avg_by_dept'] = avg_grade_by_department(dept_filter)
+    if department_id or not report:
+        context['avg_by_dept'] = avg_grade_by_department(department_id)
 
     # Course across range
     if request.args.get('report') == 'course_range':
-        course_id = request.args.get('course_id')
+        course_id = request.args.get('course_id', type=int)
         from_sem = request.args.get('from_semester')
-        from_year = request.args.get('from_year')
         to_sem = request.args.get('to_semester')
-        to_year = request.args.get('to_year')
-        context['course_id'] = int(course_id) if course_id else None
+        context['course_id'] = course_id
         context['from_semester'] = from_sem
         context['from_year'] = from_year
         context['to_semester'] = to_sem
         context['to_year'] = to_year
         if course_id:
-            context['avg_course_range'] = avg_grade_for_course_range(int(course_id), from_sem, from_year, to_sem, to_year)
+            context['avg_course_range'] = avg_grade_for_course_range(course_id, from_sem, from_year, to_sem, to_year)
 
     # Best & worst for semester
     if request.args.get('report') == 'best_worst':
         sem = request.args.get('semester')
-        yr = request.args.get('year')
+        yr = request.args.get('year', type=int)
+        top_n = max(1, min(request.args.get('top_n', 5, type=int), 50))
+        min_graded = max(1, request.args.get('min_graded', 1, type=int))
+        context['top_n'] = top_n
+        context['min_graded'] = min_graded
         if sem and yr:
-            context['best_worst'] = best_and_worst_classes(sem, int(yr), top_n=5)
-            context['year'] = int(yr)
+            context['best_worst'] = best_and_worst_classes(sem, yr, top_n=top_n, dept_id=department_id,
+                                                           min_graded=min_graded)
+            context['year'] = yr
+
+    # Course x term trends for several courses (or a department) at once
+    if request.args.get('report') == 'trend':
+        course_ids = request.args.getlist('course_ids', type=int)
+        trend_dept = request.args.get('trend_department_id', type=int)
+        trends = course_term_trends(course_ids, trend_dept,
+                                    request.args.get('from_semester'), from_year,
+                                    request.args.get('to_semester'), to_year)
+        if request.args.get('format') == 'csv':
+            return Response(trends_csv(trends), mimetype='text/csv',
+                            headers={'Content-Disposition': 'attachment; filename=course_trends.csv'})
+        context['trends'] = trends
+        context['trend_course_ids'] = course_ids
+        context['trend_department_id'] = trend_dept
+        context['from_semester'] = request.args.get('from_semester')
+        context['from_year'] = from_year
+        context['to_semester'] = request.args.get('to_semester')
+        context['to_year'] = to_year
 
     # Counts by department
     if request.args.get('report') == 'counts':
-        context['counts'] = student_counts_by_department()
+        approximate = bool(request.args.get('approx'))
+        context['counts'] = student_counts_by_department(approximate=approximate)
+        context['approx'] = approximate
+        context['approx_error_pct'] = round(2 * hll.STANDARD_ERROR * 100, 1)
 
     return render_template('instructor/reports.html', **context)
 
@@ -979,7 +1945,7 @@ def instructor_reports():
 # Minimal CRUD helpers for admin operations
 
 def get_course_by_id(course_id):
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor(dictionary=True)
         cur.execute("SELECT * FROM Course WHERE courseID = %s", (course_id,))
@@ -989,41 +1955,292 @@ def get_course_by_id(course_id):
         conn.close()
 
 def create_course(course_number, course_name, credits, departmentID):
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor()
         cur.execute("INSERT INTO Course (course_name, course_number, credits, departmentID) VALUES (%s,%s,%s,%s)",
                     (course_name, course_number, credits, departmentID))
         conn.commit()
+        bump_reference('courses')
         return cur.lastrowid
     finally:
         cur.close()
         conn.close()
 
 def update_course(course_id, course_number, course_name, credits, departmentID):
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor()
+        # a department change moves the course's grades between department summaries
+        shift_grade_summaries(cur, "s.courseID = %s", (course_id,), -1)
         cur.execute("UPDATE Course SET course_number=%s, course_name=%s, credits=%s, departmentID=%s WHERE courseID=%s",
                     (course_number, course_name, credits, departmentID, course_id))
+        shift_grade_summaries(cur, "s.courseID = %s", (course_id,), 1)
         conn.commit()
+        bump_reference('courses')
+        invalidate_reports()
     finally:
         cur.close()
         conn.close()
 
 def delete_course(course_id):
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor()
         cur.execute("DELETE FROM Course WHERE courseID=%s", (course_id,))
         conn.commit()
+        bump_reference('courses')
+        invalidate_reports()
     finally:
         cur.close()
         conn.close()
 
+# Scheduling conflicts: one timetable.TermSchedule per term (sections indexed by classroom and by
+# instructor), cached by (semester, year). Section writes are checked against it before touching
+# the database and move the section in the cached schedules after commit. The cached schedule
+# only knows this process's writes, so the write itself repeats the check in SQL under a lock on
+# the Term row (guard_section_schedule), which serializes section writes within a term.
+class SchedulingConflict(ValueError):
+    """Raised when a section write would double-book a classroom or an instructor."""
+
+SCHEDULER_TIME_BUDGET = getattr(config, 'SCHEDULER_TIME_BUDGET', 10.0)
+SCHEDULER_WRITE_BATCH = 500
+
+term_schedules = BoundedCache(maxsize=getattr(config, 'TERM_SCHEDULE_CACHE_SIZE', 16),
+                              ttl=getattr(config, 'REFERENCE_CACHE_MAX_AGE', 300))
+
+def schedule_entry(section_id, course_id, classroom_id, instructor_id, timeslot_id):
+    """A TermSchedule entry for a section, with its meeting time taken from the timeslot snapshot."""
+    slot = get_timeslot(int(timeslot_id)) if timeslot_id else None
+    return {
+        'sectionID': section_id, 'courseID': course_id,
+        'classroomID': classroom_id, 'instructorID': instructor_id,
+        'day_of_week': slot['day_of_week'] if slot else None,
+        'start': timetable.to_minutes(slot['start_time']) if slot else None,
+        'end': timetable.to_minutes(slot['end_time']) if slot else None,
+    }
+
+def get_term_schedule(semester, year):
+    key = (semester, int(year))
+    schedule = term_schedules.get(key, None)
+    if schedule is None:
+        conn = db.get_db_connection()
+        try:
+            cur = conn.cursor(dictionary=True)
+            cur.execute("""
+                SELECT s.sectionID, s.courseID, s.classroomID, s.instructorID, s.timeslotID
+                FROM Section s JOIN Term tm ON tm.termID = s.termID
+                WHERE tm.semester = %s AND tm.year = %s
+            """, key)
+            rows = cur.fetchall()
+        finally:
+            cur.close()
+            conn.close()
+        schedule = timetable.TermSchedule(
+            schedule_entry(r['sectionID'], r['courseID'], r['classroomID'], r['instructorID'], r['timeslotID'])
+            for r in rows)
+        term_schedules.set(key, schedule)
+    return schedule
+
+def scheduling_conflict(resource, other):
+    what = 'classroom' if resource == 'classroomID' else 'instructor'
+    return SchedulingConflict(f"The {what} is already booked at that time by section {other}.")
+
+def check_section_schedule(semester, year, section_id, classroom_id, instructor_id, timeslot_id):
+    """Raise SchedulingConflict if the section, placed as given, would double-book its room or instructor."""
+    entry = schedule_entry(section_id, None, classroom_id, instructor_id, timeslot_id)
+    clashes = get_term_schedule(semester, year).clashes(entry)
+    if clashes:
+        raise scheduling_conflict(*clashes[0])
+
+def guard_section_schedule(conn, cur, term_id, section_id, classroom_id, instructor_id, timeslot_id):
+    """
+    The double-booking check in SQL, for writes racing in other app processes: lock the Term row,
+    then look for a clashing section with a locking read, which sees sections committed after this
+    transaction's snapshot. Rolls back and raises SchedulingConflict on a clash.
+    """
+    cur.execute("SELECT termID FROM Term WHERE termID = %s FOR UPDATE", (term_id,))
+    cur.fetchall()
+    if not timeslot_id:
+        return
+    cur.execute("""
+        SELECT s.sectionID, s.classroomID = %s
+        FROM Section s
+        JOIN Timeslot t ON t.timeslotID = s.timeslotID
+        JOIN Timeslot mine ON mine.timeslotID = %s
+        WHERE s.termID = %s AND s.sectionID <> %s
+          AND (s.classroomID = %s OR s.instructorID = %s)
+          AND t.day_of_week = mine.day_of_week
+          AND t.start_time < mine.end_time AND mine.start_time < t.end_time
+        LIMIT 1
+        FOR UPDATE
+    """, (classroom_id, timeslot_id, term_id, section_id or 0, classroom_id, instructor_id))
+    row = cur.fetchone()
+    if row:
+        conn.rollback()
+        raise scheduling_conflict('classroomID' if row[1] else 'instructorID', row[0])
+
+def reschedule_section(section_id, semester=None, year=None, course_id=None, classroom_id=None,
+                       instructor_id=None, timeslot_id=None):
+    """Take a section out of every cached term schedule and, unless deleted, place it in its term's."""
+    for key in term_schedules.keys():
+        schedule = term_schedules.get(key, None)
+        if schedule is not None:
+            schedule.unplace(section_id)
+    if semester is not None:
+        schedule = term_schedules.get((semester, int(year)), None)
+        if schedule is not None:
+            schedule.place(schedule_entry(section_id, course_id, classroom_id, instructor_id, timeslot_id))
+
+def term_conflict_report(semester, year):
+    """Double bookings in one term with room / instructor names and course numbers."""
+    schedule = get_term_schedule(semester, year)
+    conflicts = schedule.conflicts()
+    if not conflicts:
+        return []
+    rooms = {r['classroomID']: f"{r['building_name']} {r['room_number']}" for r in get_all_classrooms()}
+    instructors = {i['instructorID']: f"{i['first_name']} {i['last_name']}" for i in get_all_instructors()}
+    courses = {c['courseID']: c['course_number'] for c in get_all_courses()}
+    report = []
+    for resource, resource_id, day, a, b in conflicts:
+        names = rooms if resource == 'classroomID' else instructors
+        report.append({
+            'resource': 'Classroom' if resource == 'classroomID' else 'Instructor',
+            'name': names.get(resource_id, resource_id),
+            'day_of_week': day,
+            'sections': [(sid, courses.get(schedule.sections.get(sid, {}).get('courseID'), '')) for sid in (a, b)],
+        })
+    return report
+
+@app.cli.command('schedule-conflicts')
+@click.option('--semester', default=None, help='Defaults to the current term.')
+@click.option('--year', type=int, default=None)
+def schedule_conflicts_command(semester, year):
+    """List classroom and instructor double bookings in one term."""
+    if not semester or not year:
+        current = get_current_term()
+        if not current:
+            click.echo("no terms")
+            return
+        semester, year = current['semester'], current['year']
+    report = term_conflict_report(semester, year)
+    for r in report:
+        (a, course_a), (b, course_b) = r['sections']
+        click.echo(f"{r['resource']} {r['name']}: sections {a} ({course_a}) and {b} ({course_b}) overlap on {r['day_of_week']}")
+    click.echo(f"{len(report)} scheduling conflict(s) in {semester} {year}")
+
+def plan_conflicts(sections, result):
+    """
+    Double bookings in the term as it would be after the moves: placed sections at their new slot
+    and room, unplaced ones where they are now. Only clashes involving a moved section count;
+    clashes the term already had between unmoved sections are not the plan's doing.
+    """
+    moved = {s['sectionID'] for s in result.changes(sections)}
+    entries = []
+    for s in sections:
+        timeslot_id, classroom_id = result.assignments.get(s['sectionID'], (s['timeslotID'], s['classroomID']))
+        entries.append(schedule_entry(s['sectionID'], s['courseID'], classroom_id, s['instructorID'], timeslot_id))
+    return [c for c in timetable.TermSchedule(entries).conflicts() if c[3] in moved or c[4] in moved]
+
+def move_sections(cur, moves):
+    """
+    Set (timeslotID, classroomID) for many sections of one term with batched UPDATEs on the
+    caller's dictionary cursor; the caller commits. Only room and time change, so grade summaries and reports are unaffected.
+    `moves` maps sectionID -> (timeslotID, classroomID).
+    """
+    ids = list(moves)
+    pages = set()
+    enrolled = set()
+    for start in range(0, len(ids), SCHEDULER_WRITE_BATCH):
+        batch = ids[start:start + SCHEDULER_WRITE_BATCH]
+        placeholders = ','.join(['%s'] * len(batch))
+        pages |= find_section_pages(cur, f"sectionID IN ({placeholders})", batch)
+        cur.execute(f"SELECT studentID FROM Enrollment WHERE sectionID IN ({placeholders})", batch)
+        enrolled.update(r['studentID'] for r in cur.fetchall())
+        cases = ' '.join(['WHEN %s THEN %s'] * len(batch))
+        cur.execute(f"UPDATE Section SET timeslotID = CASE sectionID {cases} END, "
+                    f"classroomID = CASE sectionID {cases} END "
+                    f"WHERE sectionID IN ({placeholders})",
+                    (*[v for sid in batch for v in (sid, moves[sid][0])],
+                     *[v for sid in batch for v in (sid, moves[sid][1])], *batch))
+    forget_students(enrolled)
+    bump_pages(pages)
+    db.after_commit(student_timetables.clear)
+    db.after_commit(term_schedules.clear)
+
+def schedule_term(semester, year, budget=SCHEDULER_TIME_BUDGET, reassign_all=False, dry_run=False):
+    """
+    Run the term scheduler over one term's sections against every classroom and timeslot and,
+    unless dry_run, save the moves. Everything runs in one transaction holding the Term row lock,
+    so section writes from the app wait instead of racing the plan. Raises SchedulingConflict,
+    saving nothing, if the plan would double-book anything against sections left unplaced.
+    Returns (SolveResult, changed section rows).
+    """
+    with db.transaction() as conn:
+        cur = conn.cursor(dictionary=True)
+        try:
+            cur.execute("SELECT termID FROM Term WHERE semester = %s AND year = %s FOR UPDATE", (semester, year))
+            term = cur.fetchone()
+            if not term:
+                return scheduler.solve([], [], []), []
+            # locking read: sees sections committed after the transaction's snapshot
+            cur.execute("""
+                SELECT sectionID, courseID, instructorID, classroomID, timeslotID
+                FROM Section WHERE termID = %s
+                ORDER BY sectionID
+                FOR UPDATE
+            """, (term['termID'],))
+            sections = cur.fetchall()
+            result = scheduler.solve(sections, [c['classroomID'] for c in get_all_classrooms()], get_all_timeslots(),
+                                     budget=budget, keep_current=not reassign_all)
+            changed = result.changes(sections)
+            clashes = plan_conflicts(sections, result) if changed else []
+            if clashes:
+                resource, _, _, a, b = clashes[0]
+                raise SchedulingConflict(f"the plan double-books a {'classroom' if resource == 'classroomID' else 'instructor'} "
+                                         f"(sections {a} and {b}) against sections it could not place; nothing saved")
+            if changed and not dry_run:
+                move_sections(cur, {s['sectionID']: result.assignments[s['sectionID']] for s in changed})
+        finally:
+            cur.close()
+    return result, changed
+
+@app.cli.command('schedule-term')
+@click.option('--semester', default=None, help='Defaults to the current term.')
+@click.option('--year', type=int, default=None)
+@click.option('--budget', type=float, default=None, help='Solver time limit in seconds.')
+@click.option('--reassign-all', is_flag=True, help='Re-place every section instead of only clashing ones.')
+@click.option('--dry-run', is_flag=True, help='Print the moves without saving them.')
+def schedule_term_command(semester, year, budget, reassign_all, dry_run):
+    """Assign classrooms and timeslots so no room or instructor is double-booked in one term."""
+    if not semester or not year:
+        current = get_current_term()
+        if not current:
+            click.echo("no terms")
+            return
+        semester, year = current['semester'], current['year']
+    try:
+        result, changed = schedule_term(semester, year, SCHEDULER_TIME_BUDGET if budget is None else budget,
+                                        reassign_all, dry_run)
+    except SchedulingConflict as e:
+        raise click.ClickException(str(e))
+    for s in changed:
+        timeslot_id, classroom_id = result.assignments[s['sectionID']]
+        click.echo(f"section {s['sectionID']}: timeslot {s['timeslotID']} -> {timeslot_id}, "
+                   f"classroom {s['classroomID']} -> {classroom_id}")
+    for section_id in result.unplaced:
+        click.echo(f"section {section_id}: no free classroom and timeslot found, left as is")
+    click.echo(f"{len(changed)} section(s) {'to move' if dry_run else 'moved'}, {len(result.unplaced)} unplaced "
+               f"in {result.elapsed:.2f}s{' (time budget reached)' if result.timed_out else ''}")
+
 # Section helpers
+def section_student_ids(cur, section_id):
+    """IDs of every student with an enrollment row (any status) in the section."""
+    cur.execute("SELECT studentID FROM Enrollment WHERE sectionID = %s", (section_id,))
+    return [r[0] for r in cur.fetchall()]
+
 def get_section_by_id(section_id):
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor(dictionary=True)
         cur.execute("SELECT * FROM Section WHERE sectionID = %s", (section_id,))
@@ -1033,45 +2250,74 @@ def get_section_by_id(section_id):
         conn.close()
 
 def create_section(semester, year, courseID, instructorID, classroomID, timeslotID, capacity=30):
-    conn = config.get_db_connection()
+    check_section_schedule(semester, year, None, classroomID, instructorID, timeslotID)
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor()
+        term_id = ensure_term(cur, semester, year)
+        guard_section_schedule(conn, cur, term_id, None, classroomID, instructorID, timeslotID)
         cur.execute("""
-            INSERT INTO Section (semester, year, courseID, instructorID, classroomID, timeslotID, capacity)
-            VALUES (%s,%s,%s,%s,%s,%s,%s)
-        """, (semester, year, courseID, instructorID, classroomID, timeslotID, capacity))
+            INSERT INTO Section (semester, year, termID, courseID, instructorID, classroomID, timeslotID, capacity)
+            VALUES (%s,%s,%s,%s,%s,%s,%s,%s)
+        """, (semester, year, term_id, courseID, instructorID, classroomID, timeslotID, capacity))
+        section_id = cur.lastrowid
         conn.commit()
-        return cur.lastrowid
+        bump_pages(section_pages(section_id, semester, year, instructorID))
+        db.after_commit(lambda: reschedule_section(section_id, semester, year, courseID, classroomID, instructorID, timeslotID))
+        return section_id
     finally:
         cur.close()
         conn.close()
 
 def update_section(section_id, semester, year, courseID, instructorID, classroomID, timeslotID, capacity):
-    conn = config.get_db_connection()
+    check_section_schedule(semester, year, section_id, classroomID, instructorID, timeslotID)
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor()
+        enrolled = section_student_ids(cur, section_id)
+        pages = find_section_pages(cur, "sectionID = %s", (section_id,))
+        pages.update(section_pages(section_id, semester, year, instructorID))
+        # the section's grades may move to another course/term: take them out and add them back
+        shift_grade_summaries(cur, "e.sectionID = %s", (section_id,), -1)
+        term_id = ensure_term(cur, semester, year)
+        guard_section_schedule(conn, cur, term_id, section_id, classroomID, instructorID, timeslotID)
         cur.execute("""
-            UPDATE Section SET semester=%s, year=%s, courseID=%s, instructorID=%s, classroomID=%s, timeslotID=%s, capacity=%s
+            UPDATE Section SET semester=%s, year=%s, termID=%s, courseID=%s, instructorID=%s, classroomID=%s, timeslotID=%s, capacity=%s
             WHERE sectionID=%s
-        """, (semester, year, courseID, instructorID, classroomID, timeslotID, capacity, section_id))
+        """, (semester, year, term_id, courseID, instructorID, classroomID, timeslotID, capacity, section_id))
+        shift_grade_summaries(cur, "e.sectionID = %s", (section_id,), 1)
         conn.commit()
+        invalidate_reports()
+        forget_students(enrolled)
+        bump_pages(pages)
+        db.after_commit(student_timetables.clear)
+        db.after_commit(lambda: reschedule_section(section_id, semester, year, courseID, classroomID, instructorID, timeslotID))
     finally:
         cur.close()
         conn.close()
 
 def delete_section(section_id):
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor()
+        enrolled = section_student_ids(cur, section_id)
+        pages = find_section_pages(cur, "sectionID = %s", (section_id,))
+        # graded enrollments are cascade-deleted with the section
+        shift_grade_summaries(cur, "e.sectionID = %s", (section_id,), -1)
         cur.execute("DELETE FROM Section WHERE sectionID=%s", (section_id,))
         conn.commit()
+        invalidate_reports()
+        forget_students(enrolled)
+        bump_pages(pages)
+        db.after_commit(student_timetables.clear)
+        db.after_commit(lambda: reschedule_section(section_id))
     finally:
         cur.close()
         conn.close()
 
 # Classroom CRUD
-def get_all_classrooms():
-    conn = config.get_db_connection()
+def load_classrooms():
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor(dictionary=True)
         cur.execute("SELECT cl.classroomID, cl.room_number, b.building_name FROM Classroom cl JOIN Building b ON cl.buildingID=b.buildingID ORDER BY b.building_name, cl.room_number")
@@ -1080,40 +2326,48 @@ def get_all_classrooms():
         cur.close()
         conn.close()
 
+reference_data.register('classrooms', load_classrooms)
+
+def get_all_classrooms():
+    return reference_data.get('classrooms')
+
 def create_classroom(room_number, buildingID):
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor()
         cur.execute("INSERT INTO Classroom (room_number, buildingID) VALUES (%s,%s)", (room_number, buildingID))
         conn.commit()
+        bump_reference('classrooms')
         return cur.lastrowid
     finally:
         cur.close()
         conn.close()
 
 def update_classroom(classroomID, room_number, buildingID):
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor()
         cur.execute("UPDATE Classroom SET room_number=%s, buildingID=%s WHERE classroomID=%s", (room_number, buildingID, classroomID))
         conn.commit()
+        bump_reference('classrooms')
     finally:
         cur.close()
         conn.close()
 
 def delete_classroom(classroomID):
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor()
         cur.execute("DELETE FROM Classroom WHERE classroomID=%s", (classroomID,))
         conn.commit()
+        bump_reference('classrooms')
     finally:
         cur.close()
         conn.close()
 
 # Department CRUD
 def get_department(dept_id):
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor(dictionary=True)
         cur.execute("SELECT * FROM Department WHERE departmentID=%s", (dept_id,))
@@ -1123,39 +2377,45 @@ def get_department(dept_id):
         conn.close()
 
 def create_department(name, buildingID):
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor()
         cur.execute("INSERT INTO Department (department_name, buildingID) VALUES (%s,%s)", (name, buildingID))
         conn.commit()
+        bump_reference('departments')
+        invalidate_reports()
         return cur.lastrowid
     finally:
         cur.close()
         conn.close()
 
 def update_department(dept_id, name, buildingID):
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor()
         cur.execute("UPDATE Department SET department_name=%s, buildingID=%s WHERE departmentID=%s", (name, buildingID, dept_id))
         conn.commit()
+        bump_reference('departments')
+        invalidate_reports()
     finally:
         cur.close()
         conn.close()
 
 def delete_department(dept_id):
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor()
         cur.execute("DELETE FROM Department WHERE departmentID=%s", (dept_id,))
         conn.commit()
+        bump_reference('departments')
+        invalidate_reports()
     finally:
         cur.close()
         conn.close()
 
 # Timeslot CRUD
-def get_all_timeslots():
-    conn = config.get_db_connection()
+def load_timeslots():
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor(dictionary=True)
         cur.execute("SELECT * FROM Timeslot ORDER BY day_of_week, start_time")
@@ -1164,40 +2424,63 @@ def get_all_timeslots():
         cur.close()
         conn.close()
 
+reference_data.register('timeslots', load_timeslots)
+
+def get_all_timeslots():
+    return reference_data.get('timeslots')
+
 def create_timeslot(day, start_time, end_time):
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor()
         cur.execute("INSERT INTO Timeslot (day_of_week, start_time, end_time) VALUES (%s,%s,%s)", (day, start_time, end_time))
         conn.commit()
+        bump_reference('timeslots')
         return cur.lastrowid
     finally:
         cur.close()
         conn.close()
 
 def update_timeslot(timeslotID, day, start_time, end_time):
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor()
         cur.execute("UPDATE Timeslot SET day_of_week=%s, start_time=%s, end_time=%s WHERE timeslotID=%s", (day, start_time, end_time, timeslotID))
         conn.commit()
+        bump_reference('timeslots')
     finally:
         cur.close()
         conn.close()
 
 def delete_timeslot(timeslotID):
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor()
         cur.execute("DELETE FROM Timeslot WHERE timeslotID=%s", (timeslotID,))
         conn.commit()
+        bump_reference('timeslots')
     finally:
         cur.close()
         conn.close()
 
 # Instructor & Student CRUD (admin)
+def load_instructors():
+    conn = db.get_db_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        cur.execute("SELECT instructorID, first_name, last_name, departmentID FROM Instructor ORDER BY last_name, first_name")
+        return cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
+
+reference_data.register('instructors', load_instructors)
+
+def get_all_instructors():
+    return reference_data.get('instructors')
+
 def get_instructor(instr_id):
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor(dictionary=True)
         cur.execute("SELECT instructorID, first_name, last_name, email, birth_date, departmentID FROM Instructor WHERE instructorID=%s", (instr_id,))
@@ -1207,19 +2490,22 @@ def get_instructor(instr_id):
         conn.close()
 
 def create_instructor(first, last, email, birth_date, departmentID, password_hash):
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor()
         cur.execute("INSERT INTO Instructor (first_name, last_name, email, password, birth_date, departmentID) VALUES (%s,%s,%s,%s,%s,%s)",
                     (first, last, email, password_hash, birth_date, departmentID))
+        instr_id = cur.lastrowid
+        sync_identity(conn, cur, 'instructor', instr_id, email)
         conn.commit()
-        return cur.lastrowid
+        bump_reference('instructors')
+        return instr_id
     finally:
         cur.close()
         conn.close()
 
 def update_instructor(instr_id, first, last, email, birth_date, departmentID, password_hash=None):
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor()
         if password_hash:
@@ -1228,23 +2514,27 @@ def update_instructor(instr_id, first, last, email, birth_date, departmentID, pa
         else:
             cur.execute("UPDATE Instructor SET first_name=%s, last_name=%s, email=%s, birth_date=%s, departmentID=%s WHERE instructorID=%s",
                         (first, last, email, birth_date, departmentID, instr_id))
+        sync_identity(conn, cur, 'instructor', instr_id, email)
         conn.commit()
+        bump_reference('instructors')
     finally:
         cur.close()
         conn.close()
 
 def delete_instructor(instr_id):
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor()
         cur.execute("DELETE FROM Instructor WHERE instructorID=%s", (instr_id,))
+        cur.execute("DELETE FROM UserIdentity WHERE role='instructor' AND userID=%s", (instr_id,))
         conn.commit()
+        bump_reference('instructors')
     finally:
         cur.close()
         conn.close()
 
 def get_student(student_id):
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor(dictionary=True)
         cur.execute("SELECT * FROM Student WHERE studentID=%s", (student_id,))
@@ -1254,21 +2544,23 @@ def get_student(student_id):
         conn.close()
 
 def create_student(first,last,email,password_hash,birth_date,year,term,standing,major,advisorID=None):
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor()
         cur.execute("""INSERT INTO Student
             (first_name,last_name,email,password,birth_date,year,term,standing,major,advisorID)
             VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)""",
             (first,last,email,password_hash,birth_date,year,term,standing,major,advisorID))
+        student_id = cur.lastrowid
+        sync_identity(conn, cur, 'student', student_id, email)
         conn.commit()
-        return cur.lastrowid
+        return student_id
     finally:
         cur.close()
         conn.close()
 
 def update_student(student_id, first,last,email,birth_date,year,term,standing,major,advisorID=None, password_hash=None):
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor()
         if password_hash:
@@ -1279,21 +2571,146 @@ def update_student(student_id, first,last,email,birth_date,year,term,standing,ma
             cur.execute("""UPDATE Student SET first_name=%s,last_name=%s,email=%s,birth_date=%s,year=%s,term=%s,standing=%s,major=%s,advisorID=%s
                            WHERE studentID=%s""",
                         (first,last,email,birth_date,year,term,standing,major,advisorID,student_id))
+        sync_identity(conn, cur, 'student', student_id, email)
+        pages = find_section_pages(cur, "sectionID IN (SELECT sectionID FROM Enrollment WHERE studentID = %s)", (student_id,))
         conn.commit()
+        forget_students([student_id], enrollments=False, profile=True)
+        bump_pages(key for key in pages if key[0] == 'roster')
     finally:
         cur.close()
         conn.close()
 
 def delete_student(student_id):
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor()
+        pages = find_section_pages(cur, "sectionID IN (SELECT sectionID FROM Enrollment WHERE studentID = %s)", (student_id,))
+        # enrollments go with the student (ON DELETE CASCADE); give their seats back first
+        cur.execute("""
+            UPDATE Section s JOIN Enrollment e ON e.sectionID = s.sectionID
+            SET s.enrolled_count = s.enrolled_count - 1
+            WHERE e.studentID = %s AND e.status = 'enrolled'
+        """, (student_id,))
+        shift_grade_summaries(cur, "e.studentID = %s", (student_id,), -1)
         cur.execute("DELETE FROM Student WHERE studentID=%s", (student_id,))
+        cur.execute("DELETE FROM UserIdentity WHERE role='student' AND userID=%s", (student_id,))
         conn.commit()
+        invalidate_reports()
+        student_timetables.pop(student_id)
+        forget_students([student_id], profile=True)
+        bump_pages(pages)
+    finally:
+        cur.close()
+        conn.close()
+
+
+# Keyset pagination for the admin listings: each page continues after the sort key of the last
+# row shown (an opaque cursor token), so a page costs the same however deep into the list it is.
+ADMIN_PAGE_SIZE = getattr(config, 'ADMIN_PAGE_SIZE', 50)
+ADMIN_PAGE_MAX_TERMS = getattr(config, 'ADMIN_PAGE_MAX_TERMS', 20)
+
+def encode_page_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode('utf-8')).decode('ascii')
+
+def decode_page_cursor(token, types):
+    """
+    The sort key stored in a cursor token, or None if the token is missing or malformed.
+    `types` gives the expected type of each key column (str or int).
+    """
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    except ValueError:
+        return None
+    if not isinstance(values, list) or len(values) != len(types):
+        return None
+    for value, expected in zip(values, types):
+        if type(value) is not expected:
+            return None
+    return values
+
+def get_user_page(role, after=None, page_size=ADMIN_PAGE_SIZE):
+    """
+    One page of students or instructors ordered by (last_name, first_name, id), starting after
+    the cursor token `after`. Returns (rows, next cursor token or None).
+    """
+    table, id_col = IDENTITY_SOURCES[role]
+    key = decode_page_cursor(after, (str, str, int))
+    conn = db.get_db_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        sql = f"SELECT {id_col} AS id, first_name, last_name, email, %s AS role FROM {table}"
+        params = [role]
+        if key:
+            sql += f" WHERE (last_name, first_name, {id_col}) > (%s, %s, %s)"
+            params.extend(key)
+        sql += f" ORDER BY last_name, first_name, {id_col} LIMIT %s"
+        params.append(page_size + 1)
+        cur.execute(sql, tuple(params))
+        rows = cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
+
+    if len(rows) <= page_size:
+        return rows, None
+    last = rows[page_size - 1]
+    return rows[:page_size], encode_page_cursor((last['last_name'], last['first_name'], last['id']))
+
+def get_section_page(after=None, page_size=ADMIN_PAGE_SIZE, semester=None, year=None):
+    """
+    One page of sections, most recent term first and by (courseID, sectionID) within a term,
+    starting after the cursor token `after`. Returns (rows, next cursor token or None).
+    Sections are read one term at a time along ix_section_termid, so no query sorts more
+    than a page. At most ADMIN_PAGE_MAX_TERMS terms are walked per page; a page that runs out
+    of terms first comes back short with a cursor to the start of the next term.
+    """
+    key = decode_page_cursor(after, (int, int, int, int))
+    conn = db.get_db_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        sql = "SELECT termID, ordinal FROM Term WHERE 1=1"
+        params = []
+        if semester:
+            sql += " AND semester = %s"
+            params.append(semester)
+        if year:
+            sql += " AND year = %s"
+            params.append(year)
+        if key:
+            sql += " AND (ordinal, termID) <= (%s, %s)"
+            params.extend(key[:2])
+        params.append(ADMIN_PAGE_MAX_TERMS + 1)
+        cur.execute(sql + " ORDER BY ordinal DESC, termID DESC LIMIT %s", tuple(params))
+        terms = cur.fetchall()
+
+        rows = []
+        for term in terms[:ADMIN_PAGE_MAX_TERMS]:
+            if len(rows) > page_size:
+                break
+            sql = SECTION_LISTING_SQL + " WHERE s.termID = %s"
+            params = [term['termID']]
+            if key and (term['ordinal'], term['termID']) == tuple(key[:2]):
+                sql += " AND (s.courseID, s.sectionID) > (%s, %s)"
+                params.extend(key[2:])
+            sql += " ORDER BY s.courseID, s.sectionID LIMIT %s"
+            params.append(page_size + 1 - len(rows))
+            cur.execute(sql, tuple(params))
+            rows.extend(cur.fetchall())
     finally:
         cur.close()
         conn.close()
 
+    if len(rows) > page_size:
+        last = rows[page_size - 1]
+        return rows[:page_size], encode_page_cursor((last['ordinal'], last['termID'], last['courseID'], last['sectionID']))
+    if len(terms) > ADMIN_PAGE_MAX_TERMS:
+        # (courseID, sectionID) > (-1, -1) is the whole term
+        following = terms[ADMIN_PAGE_MAX_TERMS]
+        return rows, encode_page_cursor((following['ordinal'], following['termID'], -1, -1))
+    return rows, None
+
 
 # ---------- ADMIN ROUTES ----------
 def require_admin():
@@ -1305,7 +2722,15 @@ def require_admin():
 def admin():
     if not require_admin():
         return redirect(url_for('index'))
-    return render_template('admin/index.html', user_name=session.get('user_name'))
+    cache_stats = [
+        ('Report results', report_cache.stats()),
+        ('Unknown login emails', unknown_emails.stats()),
+        ('Reference data', reference_data.stats()),
+        ('Student pages', student_data.stats()),
+    ]
+    return render_template('admin/index.html', cache_stats=cache_stats,
+                           pool_stats=db.pool_stats(), password_stats=passwords.verifier.stats(),
+                           user_name=session.get('user_name'))
 
 
 # Courses
@@ -1347,41 +2772,34 @@ def admin_course_delete(course_id):
 
 # Sections
 @app.route('/admin/sections')
+@conditional_page(lambda: [('sections',)] if require_admin() else None,
+                  references=('courses', 'instructors', 'classrooms', 'buildings', 'timeslots'))
 def admin_sections():
     if not require_admin(): return redirect(url_for('index'))
     # reuse get_sections for listing
     semester = request.args.get('semester') or None
     year = request.args.get('year') or None
-    sections = get_sections(semester=semester, year=year)
+    sections, next_cursor = get_section_page(request.args.get('after'), semester=semester, year=year)
+    report_term = (semester, year) if semester and year else None
+    if not report_term:
+        current = cached_current_term()
+        report_term = (current['semester'], current['year']) if current else None
+    conflicts = term_conflict_report(*report_term) if report_term else []
     courses = get_all_courses()
-    instructors = []  # simple list
-    # get instructor list
-    conn = config.get_db_connection()
-    try:
-        cur = conn.cursor(dictionary=True)
-        cur.execute("SELECT instructorID, first_name, last_name FROM Instructor ORDER BY last_name")
-        instructors = cur.fetchall()
-    finally:
-        cur.close()
-        conn.close()
+    instructors = get_all_instructors()
     classrooms = get_all_classrooms()
     timeslots = get_all_timeslots()
-    return render_template('admin/sections.html', sections=sections, courses=courses, instructors=instructors, classrooms=classrooms, timeslots=timeslots, user_name=session.get('user_name'))
+    return render_template('admin/sections.html', sections=sections, courses=courses, instructors=instructors, classrooms=classrooms, timeslots=timeslots,
+                           semester=semester, year=year, next_cursor=next_cursor, paged=bool(request.args.get('after')),
+                           conflicts=conflicts, conflict_term=report_term,
+                           user_name=session.get('user_name'))
 
 @app.route('/admin/section/new', methods=['GET','POST'])
 @app.route('/admin/section/<int:section_id>/edit', methods=['GET','POST'])
 def admin_section_edit(section_id=None):
     if not require_admin(): return redirect(url_for('index'))
     courses = get_all_courses()
-    instructors = []
-    conn = config.get_db_connection()
-    try:
-        cur = conn.cursor(dictionary=True)
-        cur.execute("SELECT instructorID, first_name, last_name FROM Instructor ORDER BY last_name")
-        instructors = cur.fetchall()
-    finally:
-        cur.close()
-        conn.close()
+    instructors = get_all_instructors()
     classrooms = get_all_classrooms()
     timeslots = get_all_timeslots()
     if request.method == 'GET':
@@ -1413,6 +2831,8 @@ def admin_section_delete(section_id):
 
 # Section roster (admin can view/submit grades)
 @app.route('/admin/section/<int:section_id>/roster')
+@conditional_page(lambda section_id: [('roster', section_id)] if require_admin() else None,
+                  references=('courses',))
 def admin_section_roster(section_id):
     if not require_admin(): return redirect(url_for('index'))
     section = get_section_by_id(section_id)
@@ -1425,29 +2845,26 @@ def admin_section_roster(section_id):
 @app.route('/admin/section/<int:section_id>/grades', methods=['POST'])
 def admin_section_grades(section_id):
     if not require_admin(): return redirect(url_for('index'))
-    for key, value in request.form.items():
-        if key.startswith('grade_'):
-            enrollment_id = key.split('_',1)[1]
-            grade = value.strip()
-            if grade:
-                set_enrollment_grade(enrollment_id, grade)
-    return redirect(url_for('admin_section_roster', section_id=section_id))
+    section = get_section_by_id(section_id)
+    if not section:
+        return redirect(url_for('admin_sections'))
+    results = set_section_grades(section_id, posted_grades(request.form))
+    roster = get_section_roster(section_id)
+    return render_template('instructor/section_roster.html', section=section, roster=roster,
+                           grade_summary=summarize_grade_results(results), user_name=session.get('user_name'))
 
 # Users (instructors & students) list & edit
 @app.route('/admin/users')
 def admin_users():
     if not require_admin(): return redirect(url_for('index'))
-    conn = config.get_db_connection()
-    try:
-        cur = conn.cursor(dictionary=True)
-        cur.execute("SELECT studentID AS id, first_name, last_name, email, 'student' AS role FROM Student")
-        students = cur.fetchall()
-        cur.execute("SELECT instructorID AS id, first_name, last_name, email, 'instructor' AS role FROM Instructor")
-        instructors = cur.fetchall()
-    finally:
-        cur.close()
-        conn.close()
-    return render_template('admin/users.html', students=students, instructors=instructors, user_name=session.get('user_name'))
+    students_after = request.args.get('students_after')
+    instructors_after = request.args.get('instructors_after')
+    students, students_next = get_user_page('student', students_after)
+    instructors, instructors_next = get_user_page('instructor', instructors_after)
+    return render_template('admin/users.html', students=students, instructors=instructors,
+                           students_after=students_after, students_next=students_next,
+                           instructors_after=instructors_after, instructors_next=instructors_next,
+                           user_name=session.get('user_name'))
 
 @app.route('/admin/user/<string:role>/new', methods=['GET','POST'])
 @app.route('/admin/user/<string:role>/<int:user_id>/edit', methods=['GET','POST'])
@@ -1512,13 +2929,7 @@ def admin_classrooms():
     if not require_admin(): return redirect(url_for('index'))
     if request.method == 'GET':
         classrooms = get_all_classrooms()
-        conn = config.get_db_connection()
-        try:
-            cur = conn.cursor(dictionary=True)
-            cur.execute("SELECT buildingID, building_name FROM Building ORDER BY building_name")
-            buildings = cur.fetchall()
-        finally:
-            cur.close(); conn.close()
+        buildings = get_all_buildings()
         return render_template('admin/classrooms.html', classrooms=classrooms, buildings=buildings, user_name=session.get('user_name'))
     # POST could create classroom (form: room_number, buildingID)
     room = request.form.get('room_number')
@@ -1537,13 +2948,7 @@ def admin_departments():
     if not require_admin(): return redirect(url_for('index'))
     if request.method == 'GET':
         depts = get_all_departments()
-        conn = config.get_db_connection()
-        try:
-            cur = conn.cursor(dictionary=True)
-            cur.execute("SELECT buildingID, building_name FROM Building ORDER BY building_name")
-            buildings = cur.fetchall()
-        finally:
-            cur.close(); conn.close()
+        buildings = get_all_buildings()
         return render_template('admin/departments.html', departments=depts, buildings=buildings, user_name=session.get('user_name'))
     name = request.form.get('department_name')
     buildingID = int(request.form.get('buildingID'))
@@ -1567,11 +2972,29 @@ def admin_timeslots():
 def admin_assign_instructor(section_id):
     if not require_admin(): return redirect(url_for('index'))
     instr_id = int(request.form.get('instructorID')) if request.form.get('instructorID') else None
-    conn = config.get_db_connection()
+    section = get_section_by_id(section_id)
+    if not section:
+        return redirect(url_for('admin_sections'))
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor()
+        try:
+            check_section_schedule(section['semester'], section['year'], section_id,
+                                   section['classroomID'], instr_id, section['timeslotID'])
+            guard_section_schedule(conn, cur, section['termID'], section_id,
+                                   section['classroomID'], instr_id, section['timeslotID'])
+        except SchedulingConflict as e:
+            return render_template('instructor/section_roster.html', section=section, roster=get_section_roster(section_id),
+                                   error=str(e), user_name=session.get('user_name'))
+        pages = find_section_pages(cur, "sectionID = %s", (section_id,))
+        pages.update(section_pages(section_id, section['semester'], section['year'], instr_id))
         cur.execute("UPDATE Section SET instructorID=%s WHERE sectionID=%s", (instr_id, section_id))
+        enrolled = section_student_ids(cur, section_id)
         conn.commit()
+        forget_students(enrolled)
+        bump_pages(pages)
+        db.after_commit(lambda: reschedule_section(section_id, section['semester'], section['year'], section['courseID'],
+                                                   section['classroomID'], instr_id, section['timeslotID']))
     finally:
         cur.close(); conn.close()
     return redirect(url_for('admin_section_roster', section_id=section_id))
@@ -1581,11 +3004,12 @@ def admin_assign_instructor(section_id):
 def admin_assign_advisor(student_id):
     if not require_admin(): return redirect(url_for('index'))
     advisorID = int(request.form.get('advisorID')) if request.form.get('advisorID') else None
-    conn = config.get_db_connection()
+    conn = db.get_db_connection()
     try:
         cur = conn.cursor()
         cur.execute("UPDATE Student SET advisorID=%s WHERE studentID=%s", (advisorID, student_id))
         conn.commit()
+        forget_students([student_id], enrollments=False, profile=True)
     finally:
         cur.close(); conn.close()
     return redirect(url_for('admin_users'))
@@ -1595,8 +3019,175 @@ def admin_assign_advisor(student_id):
 def admin_prereqs():
     if not require_admin(): return redirect(url_for('index'))
     courses = get_all_courses()
-    prereqs = get_course_prereqs()
-    return render_template('instructor/prereqs.html', courses=courses, prereqs=prereqs, user_name=session.get('user_name'))
+    course_prereqs = get_course_prereqs()
+    return render_template('instructor/prereqs.html', courses=courses, prereqs=course_prereqs, user_name=session.get('user_name'))
+
+# Exports: full listings streamed as CSV or NDJSON. Each export runs on its own pooled connection
+# with an unbuffered cursor, so rows go out as the server sends them and memory stays flat.
+# Orderings use Enrollment columns so an unfiltered export can be read in index order, but once a
+# semester/year filter makes MySQL start the join from Term it sorts before the first row, and
+# course-grades always sorts (it is one row per course and term, so that stays small).
+# At most EXPORT_MAX_CONCURRENT exports run at once so they can't take the whole pool; a client
+# that stops reading holds its connection until MySQL's net_write_timeout aborts the result.
+EXPORT_BATCH_SIZE = getattr(config, 'EXPORT_BATCH_SIZE', 1000)
+EXPORT_MAX_CONCURRENT = getattr(config, 'EXPORT_MAX_CONCURRENT', max(db.POOL_SIZE // 4, 1))
+export_slots = threading.BoundedSemaphore(EXPORT_MAX_CONCURRENT)
+
+class ExportsBusy(Exception):
+    """Raised when EXPORT_MAX_CONCURRENT exports are already running."""
+
+EXPORTS = {
+    'enrollments': """
+        SELECT e.enrollmentID, e.studentID, st.first_name, st.last_name, st.email,
+               e.sectionID, tm.semester, tm.year, c.course_number, c.course_name,
+               e.status, e.grade, e.grade_points
+        FROM Enrollment e
+        JOIN Student st ON st.studentID = e.studentID
+        JOIN Section s ON s.sectionID = e.sectionID
+        JOIN Term tm ON tm.termID = s.termID
+        JOIN Course c ON c.courseID = s.courseID
+        WHERE {where}
+        ORDER BY e.enrollmentID
+    """,
+    'rosters': """
+        SELECT e.sectionID, tm.semester, tm.year, c.course_number, c.course_name,
+               i.first_name AS instr_first, i.last_name AS instr_last,
+               e.enrollmentID, e.studentID, st.first_name, st.last_name, st.email, e.grade
+        FROM Enrollment e
+        JOIN Student st ON st.studentID = e.studentID
+        JOIN Section s ON s.sectionID = e.sectionID
+        JOIN Term tm ON tm.termID = s.termID
+        JOIN Course c ON c.courseID = s.courseID
+        LEFT JOIN Instructor i ON i.instructorID = s.instructorID
+        WHERE e.status = 'enrolled' AND {where}
+        ORDER BY e.sectionID
+    """,
+    'grades': """
+        SELECT e.sectionID, tm.semester, tm.year, c.course_number, c.course_name,
+               e.studentID, st.first_name, st.last_name, e.grade, e.grade_points
+        FROM Enrollment e
+        JOIN Student st ON st.studentID = e.studentID
+        JOIN Section s ON s.sectionID = e.sectionID
+        JOIN Term tm ON tm.termID = s.termID
+        JOIN Course c ON c.courseID = s.courseID
+        WHERE e.grade_points IS NOT NULL AND {where}
+        ORDER BY e.sectionID
+    """,
+    'course-grades': """
+        SELECT c.course_number, c.course_name, tm.semester, tm.year,
+               g.graded_count, g.points_sum / g.graded_count AS avg_gpa
+        FROM GradeSummaryCourse g
+        JOIN Term tm ON tm.semester = g.semester AND tm.year = g.year
+        JOIN Course c ON c.courseID = g.courseID
+        WHERE g.graded_count > 0 AND {where}
+        ORDER BY g.courseID, tm.ordinal
+    """,
+}
+
+class ExportStream:
+    """
+    Row batches of one running export query. close() hands the connection back once the result
+    has been read, or drops it if the stream was abandoned early, and frees the export slot;
+    it is safe to call twice.
+    """
+
+    def __init__(self, conn, cur):
+        self.conn = conn
+        self.cur = cur
+        self.columns = cur.column_names
+        self.finished = False
+
+    def __iter__(self):
+        while self.conn is not None:
+            rows = self.cur.fetchmany(EXPORT_BATCH_SIZE)
+            if not rows:
+                self.finished = True
+                self.close()
+                return
+            yield rows
+
+    def close(self):
+        if self.conn is None:
+            return
+        conn, self.conn = self.conn, None
+        try:
+            if self.finished:
+                self.cur.close()
+                conn.close()
+            else:
+                # reading the rest of an unread result just to reuse the connection isn't worth it
+                conn.discard()
+        finally:
+            export_slots.release()
+
+def open_export(kind, semester=None, year=None, section_id=None):
+    """
+    Start an export query on its own pooled connection with an unbuffered cursor.
+    Raises ExportsBusy when EXPORT_MAX_CONCURRENT exports are already running.
+    """
+    clauses, params = [], []
+    if semester:
+        clauses.append("tm.semester = %s")
+        params.append(semester)
+    if year:
+        clauses.append("tm.year = %s")
+        params.append(year)
+    if section_id and kind != 'course-grades':
+        clauses.append("e.sectionID = %s")
+        params.append(section_id)
+    if not export_slots.acquire(blocking=False):
+        raise ExportsBusy("too many exports running")
+    try:
+        conn = db.pool.connection()
+    except Exception:
+        export_slots.release()
+        raise
+    try:
+        cur = conn.cursor(buffered=False)
+        cur.execute(EXPORTS[kind].format(where=' AND '.join(clauses) or '1=1'), tuple(params))
+    except Exception:
+        conn.discard()
+        export_slots.release()
+        raise
+    return ExportStream(conn, cur)
+
+def export_csv(stream):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(stream.columns)
+    yield out.getvalue()
+    for rows in stream:
+        out.seek(0)
+        out.truncate()
+        writer.writerows(rows)
+        yield out.getvalue()
+
+def export_ndjson(stream):
+    for rows in stream:
+        yield ''.join(json.dumps(dict(zip(stream.columns, row)), default=str) + '\n' for row in rows)
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', export_csv),
+    'ndjson': ('application/x-ndjson', export_ndjson),
+}
+
+@app.route('/admin/export/<string:kind>')
+def admin_export(kind):
+    """Stream an export; query params: format (csv|ndjson), semester, year, section_id."""
+    if not require_admin(): return redirect(url_for('index'))
+    fmt = request.args.get('format', 'csv')
+    if kind not in EXPORTS or fmt not in EXPORT_FORMATS:
+        return redirect(url_for('admin'))
+    mimetype, render = EXPORT_FORMATS[fmt]
+    try:
+        stream = open_export(kind, request.args.get('semester') or None,
+                             request.args.get('year') or None, request.args.get('section_id') or None)
+    except ExportsBusy:
+        return "Too many exports are running right now, please try again in a moment.", 503
+    response = Response(render(stream), mimetype=mimetype,
+                        headers={'Content-Disposition': f'attachment; filename={kind}.{fmt}'})
+    response.call_on_close(stream.close)
+    return response
 
 
 
@@ -0,0 +1,279 @@
+# cache.py
+# Small in-process caches shared by the app helpers.
+import threading
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+
+MISSING = object()
+
+
+class BoundedCache:
+    """Thread-safe LRU mapping with an optional per-entry TTL and hit/miss counters."""
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, default=MISSING):
+        """Return the cached value, or `default` (MISSING unless given) when absent or expired."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=MISSING):
+        with self._lock:
+            self._set(key, value, ttl)
+
+    def _set(self, key, value, ttl=MISSING):
+        ttl = self.ttl if ttl is MISSING else ttl
+        expires = time.monotonic() + ttl if ttl is not None else None
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_load(self, key, load):
+        """
+        The cached value, or load() it and cache the result. A pop() or clear() while loading
+        means the result may predate a write, so it is returned but not kept.
+        """
+        value = self.get(key)
+        if value is not MISSING:
+            return value
+        generation = self.invalidations
+        value = load()
+        with self._lock:
+            if generation == self.invalidations:
+                self._set(key, value)
+        return value
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            self.invalidations += 1
+        return entry[0] if entry is not None else None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.invalidations += 1
+
+    def keys(self):
+        with self._lock:
+            return list(self._data)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_rate': round(self.hits / total, 3) if total else None,
+            }
+
+
+class ReportCache:
+    """
+    Caches report results keyed by (report name, arguments). Each entry records the data it was
+    computed from ('grades' and/or 'enrollments') and the term ordinal range it covers (None for
+    an open end). Entries whose range ended before the current term are closed and expire after
+    `closed_ttl` seconds; all others after `ttl`. Invalidation only reaches this process, so
+    closed_ttl bounds how long another process's grade change can go unseen. Results are shared
+    between requests, so they are stored frozen (see freeze()).
+    """
+
+    def __init__(self, maxsize=512, ttl=300, closed_ttl=3600):
+        self.ttl = ttl
+        self.closed_ttl = closed_ttl
+        self._entries = BoundedCache(maxsize=maxsize, ttl=ttl)
+        self._deps = {}
+        self._lock = threading.Lock()
+        self.invalidations = 0
+
+    def get_or_compute(self, key, compute, sources, low=None, high=None, closed=False):
+        value = self._entries.get(key)
+        if value is not MISSING:
+            return value
+        generation = self.invalidations
+        value = freeze(compute())
+        with self._lock:
+            if generation != self.invalidations:
+                # data changed while computing; don't keep a possibly stale result
+                return value
+            self._entries.set(key, value, ttl=self.closed_ttl if closed else self.ttl)
+            self._deps[key] = (frozenset(sources), low, high)
+            if len(self._deps) > 2 * self._entries.maxsize:
+                live = set(self._entries.keys())
+                self._deps = {k: v for k, v in self._deps.items() if k in live}
+        return value
+
+    def invalidate(self, source=None, ordinal=None):
+        """
+        Drop entries built from `source` whose term range covers `ordinal`.
+        No ordinal means every term; no source means every entry.
+        """
+        with self._lock:
+            if source is None:
+                self._entries.clear()
+                self._deps.clear()
+                self.invalidations += 1
+                return
+            for key, (sources, low, high) in list(self._deps.items()):
+                if source not in sources:
+                    continue
+                if ordinal is not None and ((low is not None and ordinal < low) or (high is not None and ordinal > high)):
+                    continue
+                self._entries.pop(key)
+                del self._deps[key]
+            self.invalidations += 1
+
+    def stats(self):
+        stats = self._entries.stats()
+        stats['invalidations'] = self.invalidations
+        return stats
+
+
+def freeze(value):
+    """Deep read-only copy of a result built from dicts and lists (mappingproxy / tuple)."""
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def freeze_rows(rows):
+    """Read-only copy of a list of row dicts (tuple of mappingproxy) safe to share between requests."""
+    return tuple(MappingProxyType(dict(row)) for row in rows)
+
+
+class ReferenceCache:
+    """
+    Snapshots of small, rarely changing tables (courses, departments, rooms, ...). Each entity has
+    a loader and a version stamp; bump() from the entity's write helpers drops its snapshot so the
+    next reader reloads it. Snapshots also expire after `max_age` seconds, which is how changes
+    made by other app processes show up. Readers get the same frozen rows until then.
+    """
+
+    def __init__(self, max_age=300):
+        self.max_age = max_age
+        self._loaders = {}
+        self._versions = {}
+        self._snapshots = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.bumps = 0
+
+    def register(self, entity, loader):
+        with self._lock:
+            self._loaders[entity] = loader
+            self._versions.setdefault(entity, 0)
+
+    def version(self, entity):
+        with self._lock:
+            return self._versions[entity]
+
+    def get(self, entity):
+        now = time.monotonic()
+        with self._lock:
+            version = self._versions[entity]
+            snapshot = self._snapshots.get(entity)
+            if snapshot is not None and snapshot[0] == version:
+                if now - snapshot[1] < self.max_age:
+                    self.hits += 1
+                    return snapshot[2]
+                self.expired += 1
+            self.misses += 1
+            loader = self._loaders[entity]
+        rows = freeze_rows(loader())
+        with self._lock:
+            # a bump while loading means the rows may predate the change; serve them but don't keep them
+            if self._versions[entity] == version:
+                self._snapshots[entity] = (version, now, rows)
+        return rows
+
+    def bump(self, entity):
+        with self._lock:
+            self._versions[entity] += 1
+            self._snapshots.pop(entity, None)
+            self.bumps += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._snapshots),
+                'maxsize': len(self._loaders),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.expired,
+                'invalidations': self.bumps,
+                'hit_rate': round(self.hits / total, 3) if total else None,
+                'versions': dict(self._versions),
+            }
+
+
+class VersionStamps:
+    """
+    Data version stamps for conditional GETs, keyed like ('roster', sectionID). Write helpers
+    bump() the keys a change touches; pages build their ETag from stamp(), which returns
+    (version, unix time it last changed). Stamps live in one process, so a stamp older than
+    `max_age` seconds is renewed as if bumped: a write made by another process shows up by then.
+    """
+
+    def __init__(self, max_age=300, maxsize=100000):
+        self.max_age = max_age
+        self.maxsize = maxsize
+        self._stamps = {}
+        self._lock = threading.Lock()
+        self.bumps = 0
+
+    def stamp(self, key):
+        now = time.time()
+        with self._lock:
+            stamp = self._stamps.get(key)
+            if stamp is None or now - stamp[1] >= self.max_age:
+                stamp = self._set(key, stamp, now)
+            return stamp
+
+    def bump(self, key):
+        with self._lock:
+            self._set(key, self._stamps.get(key), time.time())
+            self.bumps += 1
+
+    def _set(self, key, old, now):
+        if len(self._stamps) >= self.maxsize and old is None:
+            # dropping every stamp only makes pages re-render once
+            self._stamps.clear()
+        stamp = ((old[0] + 1) if old else 0, now)
+        self._stamps[key] = stamp
+        return stamp
+
+    def clear(self):
+        """Renew every stamp, e.g. after a bulk repair."""
+        with self._lock:
+            self._stamps.clear()
+            self.bumps += 1
@@ -0,0 +1,239 @@
+# db.py
+# Connection pooling on top of config.get_db_connection(), plus one shared connection per request.
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_app_context
+
+import config
+
+POOL_SIZE = getattr(config, 'DB_POOL_SIZE', 10)
+POOL_TIMEOUT = getattr(config, 'DB_POOL_TIMEOUT', 5.0)
+
+
+class PoolExhausted(Exception):
+    """Raised when no pooled connection frees up within the wait timeout."""
+
+
+class PooledConnection:
+    """Wraps a raw MySQL connection; close() hands it back to the pool instead of disconnecting."""
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def close(self):
+        if self._raw is None:
+            return
+        raw, self._raw = self._raw, None
+        self._pool.release(raw)
+
+    def discard(self):
+        """Disconnect instead of returning to the pool (e.g. with an unread streaming result)."""
+        if self._raw is None:
+            return
+        raw, self._raw = self._raw, None
+        self._pool._discard(raw)
+
+
+class ConnectionPool:
+    """
+    Fixed-size pool of MySQL connections created lazily through `factory`.
+    Connections are health-checked on checkout and replaced if the server dropped them.
+    """
+
+    def __init__(self, factory, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.factory = factory
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self.stats = {'checkouts': 0, 'waits': 0, 'exhausted': 0, 'created': 0, 'discarded': 0}
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _try_create(self):
+        with self._lock:
+            if self._created >= self.size:
+                return None
+            self._created += 1
+            self.stats['created'] += 1
+        try:
+            return self.factory()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def _discard(self, raw):
+        with self._lock:
+            self._created -= 1
+            self.stats['discarded'] += 1
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _healthy(self, raw):
+        try:
+            return raw.is_connected()
+        except Exception:
+            return False
+
+    def connection(self):
+        """Check out a connection, waiting up to `timeout` seconds when the pool is at capacity."""
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        while True:
+            try:
+                raw = self._idle.get_nowait()
+            except queue.Empty:
+                raw = self._try_create()
+                if raw is None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._count('exhausted')
+                        raise PoolExhausted(f"no database connection available after {self.timeout}s")
+                    if not waited:
+                        self._count('waits')
+                        waited = True
+                    try:
+                        raw = self._idle.get(timeout=remaining)
+                    except queue.Empty:
+                        continue
+                else:
+                    self._count('checkouts')
+                    return PooledConnection(self, raw)
+
+            if not self._healthy(raw):
+                self._discard(raw)
+                continue
+            self._count('checkouts')
+            return PooledConnection(self, raw)
+
+    def release(self, raw):
+        # drop whatever transaction the caller left open so the next user starts clean
+        try:
+            raw.rollback()
+        except Exception:
+            self._discard(raw)
+            return
+        self._idle.put(raw)
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['open'] = self._created
+        stats['idle'] = self._idle.qsize()
+        stats['size'] = self.size
+        return stats
+
+
+class ScopedConnection:
+    """
+    The connection bound to the current app/request context. Every helper called during the
+    request gets this same object; close() is a no-op and the connection goes back to the pool
+    in teardown. Inside transaction() helper commits are deferred until the block ends.
+    Cursors default to buffered so one helper's open cursor never blocks the next query.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+        self.in_transaction = False
+        self.after_commit = []
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        kwargs.setdefault('buffered', True)
+        return self._conn.cursor(*args, **kwargs)
+
+    def commit(self):
+        if not self.in_transaction:
+            self._conn.commit()
+
+    def close(self):
+        pass
+
+    def release(self):
+        self._conn.close()
+
+
+pool = ConnectionPool(config.get_db_connection)
+
+
+def get_db_connection():
+    """
+    Return the connection for the current app/request context, checking one out of the pool on
+    first use. Outside an app context (scripts, threads) a plain pooled connection is returned;
+    calling close() on it returns it to the pool.
+    """
+    if not has_app_context():
+        return pool.connection()
+    conn = g.get('_db_conn')
+    if conn is None:
+        conn = g._db_conn = ScopedConnection(pool.connection())
+    return conn
+
+
+def release_db_connection(exc=None):
+    conn = g.pop('_db_conn', None)
+    if conn is not None:
+        conn.release()
+
+
+@contextmanager
+def transaction():
+    """
+    Run the enclosed helpers as one transaction on the context's connection: their commit()
+    calls are deferred, everything is committed at the end or rolled back on error.
+    Nested blocks join the outer transaction.
+    """
+    if not has_app_context():
+        raise RuntimeError("db.transaction() needs an app or request context")
+    conn = get_db_connection()
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.in_transaction = True
+    conn.after_commit = []
+    try:
+        yield conn
+        conn._conn.commit()
+    except Exception:
+        conn._conn.rollback()
+        raise
+    finally:
+        conn.in_transaction = False
+        callbacks, conn.after_commit = conn.after_commit, []
+    for callback in callbacks:
+        callback()
+
+
+def after_commit(callback):
+    """
+    Run `callback` once the current work is committed: immediately, or at the end of the
+    enclosing transaction() block (not at all if it rolls back). For cache invalidation.
+    """
+    conn = g.get('_db_conn') if has_app_context() else None
+    if conn is not None and conn.in_transaction:
+        conn.after_commit.append(callback)
+    else:
+        callback()
+
+
+def init_app(app):
+    app.teardown_appcontext(release_db_connection)
+
+
+def pool_stats():
+    return pool.snapshot()
@@ -0,0 +1,373 @@
+# migrations.py
+# Versioned schema changes applied on top of queries/schema-ddl.sql.
+#
+#   flask --app app migrate            apply pending migrations
+#   flask --app app migrate --status   list applied / pending versions
+#   flask --app app migrate --report   show which app.py queries each migration serves
+#
+# or `python migrations.py [--status|--report]` without Flask.
+# Each migration is a list of statements (plus an optional 'run' step that gets the cursor, for
+# backfills that need Python) and the helpers in app.py it exists for.
+# MySQL commits DDL implicitly, so a migration that fails halfway is fixed by hand and re-run.
+import sys
+
+import click
+
+import config
+import db
+import hll
+
+
+class MigrationError(Exception):
+    """A migration found data it can't migrate; nothing of that migration was applied."""
+
+
+def create_user_identity(cur):
+    """
+    Create the cross-role login table and fill it from Admin / Instructor / Student. Emails must be
+    unique across the three tables; duplicates are listed and the migration stops before creating
+    anything, so they can be fixed and the migration re-run.
+    """
+    cur.execute("""
+        SELECT LOWER(email), GROUP_CONCAT(CONCAT(role, ' ', id) ORDER BY role, id SEPARATOR ', ')
+        FROM (SELECT email, 'admin' AS role, adminID AS id FROM Admin
+              UNION ALL SELECT email, 'instructor', instructorID FROM Instructor
+              UNION ALL SELECT email, 'student', studentID FROM Student) accounts
+        GROUP BY LOWER(email)
+        HAVING COUNT(*) > 1
+        ORDER BY LOWER(email)
+    """)
+    duplicates = cur.fetchall()
+    if duplicates:
+        raise MigrationError("emails used by more than one account (make them unique, then re-run):\n"
+                             + "\n".join(f"  {email}: {accounts}" for email, accounts in duplicates))
+    cur.execute("SHOW TABLES LIKE 'UserIdentity'")
+    if cur.fetchall():
+        # created by an older schema-ddl.sql, possibly missing accounts its INSERT IGNORE skipped
+        cur.execute("DROP TABLE UserIdentity")
+    cur.execute("""
+        CREATE TABLE UserIdentity (
+          email VARCHAR(150) NOT NULL PRIMARY KEY,
+          role VARCHAR(20) NOT NULL,
+          userID INT NOT NULL,
+          password VARCHAR(255) NOT NULL,
+          CONSTRAINT uc_identity_user UNIQUE (role, userID)
+        ) ENGINE=InnoDB
+    """)
+    for role, table, id_col in (('admin', 'Admin', 'adminID'), ('instructor', 'Instructor', 'instructorID'),
+                                ('student', 'Student', 'studentID')):
+        cur.execute(f"INSERT INTO UserIdentity (email, role, userID, password) "
+                    f"SELECT email, %s, {id_col}, password FROM {table}", (role,))
+
+
+MIGRATIONS = [
+    {
+        'version': 1,
+        'name': 'Enrollment (sectionID, status) index',
+        'sql': [
+            "CREATE INDEX ix_enrollment_section_status ON Enrollment (sectionID, status)",
+        ],
+        'serves': [
+            'reconcile_seat_counts: enrolled rows per section',
+            'release_seat: enrollment -> section join',
+            'get_section_roster: roster for one section',
+        ],
+    },
+    {
+        'version': 2,
+        'name': 'Enrollment (studentID, status, sectionID) covering index',
+        'sql': [
+            "CREATE INDEX ix_enrollment_student_status ON Enrollment (studentID, status, sectionID)",
+        ],
+        'serves': [
+            'load_student_enrollments: enrollments of one student',
+            'get_completed_courses: completed courses for the prerequisite check',
+            'update_student / delete_student: sections one student is enrolled in',
+        ],
+    },
+    {
+        'version': 3,
+        'name': 'Section (semester, year, courseID) index',
+        'sql': [
+            "CREATE INDEX ix_section_term ON Section (semester, year, courseID)",
+        ],
+        'serves': [
+            'nothing any more, dropped again by v13',
+        ],
+    },
+    {
+        'version': 4,
+        'name': 'Section (instructorID, year, semester) index',
+        'sql': [
+            "CREATE INDEX ix_section_instructor_year ON Section (instructorID, year, semester)",
+        ],
+        'serves': [
+            'get_instructor_sections: sections taught by one instructor (the term filter joins Term)',
+            'instructor_section_roster: section ownership check',
+        ],
+    },
+    {
+        'version': 5,
+        'name': 'Course (course_number) index',
+        'sql': [
+            "CREATE INDEX ix_course_number ON Course (course_number)",
+        ],
+        'serves': [
+            'load_courses: ORDER BY course_number for the courses snapshot',
+        ],
+    },
+    {
+        'version': 6,
+        'name': 'Section.enrolled_count seat counter',
+        'sql': [
+            "ALTER TABLE Section ADD COLUMN enrolled_count INT NOT NULL DEFAULT 0",
+            """UPDATE Section s
+               LEFT JOIN (SELECT sectionID, COUNT(*) AS n FROM Enrollment WHERE status = 'enrolled' GROUP BY sectionID) x
+                 ON x.sectionID = s.sectionID
+               SET s.enrolled_count = COALESCE(x.n, 0)""",
+        ],
+        'serves': [
+            'get_sections / get_instructor_sections: enrolled_count without a per-row COUNT',
+            'student_register: capacity check',
+        ],
+    },
+    {
+        'version': 7,
+        'name': 'GradeScale table and stored Enrollment.grade_points',
+        'sql': [
+            """CREATE TABLE GradeScale (
+                 grade VARCHAR(6) PRIMARY KEY,
+                 points DECIMAL(3,2) NOT NULL
+               ) ENGINE=InnoDB""",
+            """INSERT INTO GradeScale (grade, points) VALUES
+               ('A', 4.0), ('A-', 3.7), ('B+', 3.3), ('B', 3.0), ('B-', 2.7), ('C+', 2.3),
+               ('C', 2.0), ('C-', 1.7), ('D+', 1.3), ('D', 1.0), ('F', 0.0)""",
+            "ALTER TABLE Enrollment ADD COLUMN grade_points DECIMAL(3,2) NULL",
+            "UPDATE Enrollment e JOIN GradeScale g ON g.grade = e.grade SET e.grade_points = g.points",
+            "CREATE INDEX ix_enrollment_section_points ON Enrollment (sectionID, grade_points)",
+        ],
+        'serves': [
+            'shift_grade_summaries / rebuild-report-summaries: grade points per section read from the index',
+            'set_section_grades: grade validation and points lookup',
+        ],
+    },
+    {
+        'version': 8,
+        'name': 'Per-term grade summary tables for reports',
+        'sql': [
+            """CREATE TABLE GradeSummaryCourse (
+                 courseID INT NOT NULL,
+                 semester VARCHAR(30) NOT NULL,
+                 year INT NOT NULL,
+                 graded_count INT NOT NULL DEFAULT 0,
+                 points_sum DECIMAL(14,2) NOT NULL DEFAULT 0,
+                 PRIMARY KEY (courseID, year, semester),
+                 KEY ix_grade_summary_course_term (year, semester)
+               ) ENGINE=InnoDB""",
+            """CREATE TABLE GradeSummaryDepartment (
+                 departmentID INT NOT NULL,
+                 semester VARCHAR(30) NOT NULL,
+                 year INT NOT NULL,
+                 graded_count INT NOT NULL DEFAULT 0,
+                 points_sum DECIMAL(14,2) NOT NULL DEFAULT 0,
+                 PRIMARY KEY (departmentID, year, semester)
+               ) ENGINE=InnoDB""",
+            """INSERT INTO GradeSummaryCourse (courseID, semester, year, graded_count, points_sum)
+               SELECT s.courseID, s.semester, s.year, COUNT(*), SUM(e.grade_points)
+               FROM Enrollment e JOIN Section s ON s.sectionID = e.sectionID
+               WHERE e.grade_points IS NOT NULL
+               GROUP BY s.courseID, s.semester, s.year""",
+            """INSERT INTO GradeSummaryDepartment (departmentID, semester, year, graded_count, points_sum)
+               SELECT c.departmentID, s.semester, s.year, COUNT(*), SUM(e.grade_points)
+               FROM Enrollment e JOIN Section s ON s.sectionID = e.sectionID JOIN Course c ON c.courseID = s.courseID
+               WHERE e.grade_points IS NOT NULL
+               GROUP BY c.departmentID, s.semester, s.year""",
+        ],
+        'serves': [
+            'avg_grade_by_department: reads department summaries instead of Enrollment',
+            'avg_grade_for_course_range: course summary rows for one course',
+            'best_and_worst_classes: course summary rows for one term',
+        ],
+    },
+    {
+        'version': 9,
+        'name': 'HyperLogLog headcount sketches per department',
+        'sql': [
+            """CREATE TABLE DepartmentHeadcountSketch (
+                 departmentID INT NOT NULL,
+                 bucket SMALLINT NOT NULL,
+                 registers VARBINARY(64) NOT NULL,
+                 PRIMARY KEY (departmentID, bucket)
+               ) ENGINE=InnoDB""",
+        ],
+        'run': hll.rebuild_sketches,
+        'serves': [
+            'student_counts_by_department(approximate=True): historical headcount estimate',
+            'register_student: one register upsert per new enrollment',
+        ],
+    },
+    {
+        'version': 10,
+        'name': 'Term dimension with integer ordinal, referenced from Section',
+        'sql': [
+            """CREATE TABLE Term (
+                 termID INT AUTO_INCREMENT PRIMARY KEY,
+                 semester VARCHAR(30) NOT NULL,
+                 year INT NOT NULL,
+                 ordinal INT NOT NULL,
+                 CONSTRAINT uc_term UNIQUE (semester, year),
+                 KEY ix_term_ordinal (ordinal)
+               ) ENGINE=InnoDB""",
+            """INSERT INTO Term (semester, year, ordinal)
+               SELECT DISTINCT semester, year,
+                      year * 10 + CASE semester WHEN 'Spring' THEN 1 WHEN 'Summer' THEN 2 WHEN 'Fall' THEN 3 ELSE 4 END
+               FROM Section""",
+            "ALTER TABLE Section ADD COLUMN termID INT NULL",
+            "UPDATE Section s JOIN Term t ON t.semester = s.semester AND t.year = s.year SET s.termID = t.termID",
+            """ALTER TABLE Section MODIFY termID INT NOT NULL,
+               ADD CONSTRAINT fk_section_term FOREIGN KEY (termID)
+                 REFERENCES Term(termID) ON DELETE RESTRICT ON UPDATE CASCADE""",
+            "CREATE INDEX ix_section_termid ON Section (termID, courseID)",
+        ],
+        'serves': [
+            'get_sections / get_instructor_sections / get_student_enrollments: ORDER BY Term.ordinal',
+            'get_section_page: one term at a time in (courseID, sectionID) order',
+            'avg_grade_for_course_range / rank_courses: term range as an ordinal range',
+            'student_course_info: current term default',
+        ],
+    },
+    {
+        'version': 11,
+        'name': 'Student / Instructor (last_name, first_name) indexes',
+        'sql': [
+            "CREATE INDEX ix_student_name ON Student (last_name, first_name)",
+            "CREATE INDEX ix_instructor_name ON Instructor (last_name, first_name)",
+        ],
+        'serves': [
+            'get_user_page: admin user listing seek on (last_name, first_name, id)',
+        ],
+    },
+    {
+        'version': 12,
+        'name': 'UserIdentity login lookup (emails unique across roles)',
+        'sql': [],
+        'run': create_user_identity,
+        'serves': [
+            'get_user_by_email: one primary key lookup per login',
+            'sync_identity: account create / update / delete keep it in sync',
+        ],
+    },
+    {
+        'version': 13,
+        'name': 'Drop the unused Section (semester, year, courseID) index',
+        'sql': [
+            "DROP INDEX ix_section_term ON Section",
+        ],
+        'serves': [
+            'Section writes: one index less to maintain; get_sections filters through Term and'
+            ' ix_section_termid (v10), best_and_worst_classes reads GradeSummaryCourse (v8)',
+        ],
+    },
+]
+
+
+def ensure_migration_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS SchemaMigration (
+          version INT PRIMARY KEY,
+          name VARCHAR(200) NOT NULL,
+          applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB
+    """)
+
+
+def applied_versions(conn):
+    cur = conn.cursor()
+    try:
+        ensure_migration_table(cur)
+        cur.execute("SELECT version FROM SchemaMigration")
+        return {row[0] for row in cur.fetchall()}
+    finally:
+        cur.close()
+
+
+def pending_migrations(conn):
+    done = applied_versions(conn)
+    return [m for m in MIGRATIONS if m['version'] not in done]
+
+
+def apply_migrations(conn, target=None, echo=print):
+    """Apply pending migrations in version order (up to `target` if given); returns the versions applied."""
+    applied = []
+    cur = conn.cursor()
+    try:
+        for m in pending_migrations(conn):
+            if target is not None and m['version'] > target:
+                break
+            echo(f"applying {m['version']:04d} {m['name']}")
+            for stmt in m['sql']:
+                cur.execute(stmt)
+            if m.get('run'):
+                m['run'](cur)
+            cur.execute("INSERT INTO SchemaMigration (version, name) VALUES (%s, %s)", (m['version'], m['name']))
+            conn.commit()
+            applied.append(m['version'])
+    finally:
+        cur.close()
+    return applied
+
+
+def status_lines(conn):
+    done = applied_versions(conn)
+    return [f"{m['version']:04d} {'applied' if m['version'] in done else 'pending':8} {m['name']}" for m in MIGRATIONS]
+
+
+def report_lines():
+    lines = []
+    for m in MIGRATIONS:
+        lines.append(f"{m['version']:04d} {m['name']}")
+        lines.extend(f"       serves {use}" for use in m.get('serves', []))
+    return lines
+
+
+def run(conn, status=False, report=False, target=None, echo=print):
+    if report:
+        for line in report_lines():
+            echo(line)
+    elif status:
+        for line in status_lines(conn):
+            echo(line)
+    else:
+        try:
+            applied = apply_migrations(conn, target=target, echo=echo)
+        except MigrationError as e:
+            echo(f"migration stopped: {e}")
+            raise SystemExit(1)
+        echo(f"{len(applied)} migration(s) applied" if applied else "database is up to date")
+
+
+def init_app(app):
+    @app.cli.command('migrate')
+    @click.option('--status', is_flag=True, help='List applied and pending migrations.')
+    @click.option('--report', is_flag=True, help='Show which queries each migration serves.')
+    @click.option('--to', 'target', type=int, default=None, help='Stop after this version.')
+    def migrate_command(status, report, target):
+        """Apply pending schema migrations to the configured database."""
+        conn = db.get_db_connection()
+        run(conn, status=status, report=report, target=target, echo=click.echo)
+
+    if getattr(config, 'AUTO_MIGRATE', False):
+        with app.app_context():
+            apply_migrations(db.get_db_connection())
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if '--report' in args:
+        run(None, report=True)
+    else:
+        conn = config.get_db_connection()
+        try:
+            run(conn, status='--status' in args)
+        finally:
+            conn.close()
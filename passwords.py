@@ -0,0 +1,122 @@
+# passwords.py
+# Password verification. Salted werkzeug hashes are slow on purpose, so they are checked in a
+# small bounded worker pool instead of on the WSGI worker handling /login.
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from werkzeug.security import check_password_hash
+
+import config
+
+WORKERS = getattr(config, 'PASSWORD_WORKERS', 4)
+MAX_PENDING = getattr(config, 'PASSWORD_MAX_PENDING', 32)
+VERIFY_TIMEOUT = getattr(config, 'PASSWORD_VERIFY_TIMEOUT', 10.0)
+
+
+class VerifierBusy(Exception):
+    """Raised when the verification queue is full (or a check timed out); the login should be retried."""
+
+
+def hash_scheme(stored):
+    """Name of the scheme a stored password uses: 'sha256-hex', 'pbkdf2', 'scrypt', ... or 'unknown'."""
+    stored = (stored or '').strip()
+    if len(stored) == 64 and all(c in "0123456789abcdefABCDEF" for c in stored):
+        return 'sha256-hex'
+    if '$' in stored:
+        return stored.split('$', 1)[0].split(':', 1)[0] or 'unknown'
+    return 'unknown'
+
+
+def verify_password(stored_password: str, provided_password: str) -> bool:
+
+    if not stored_password:
+        return False
+
+    stored = stored_password.strip()
+
+    if len(stored) == 64 and all(c in "0123456789abcdefABCDEF" for c in stored):
+        provided_hash = hashlib.sha256(provided_password.encode('utf-8')).hexdigest()
+        return provided_hash.lower() == stored.lower()
+    # If stored password is not a plain hex sha256, try werkzeug's check for salted hashes
+    try:
+        return bool(check_password_hash(stored, provided_password))
+    except Exception:
+        return False
+
+
+class PasswordVerifier:
+    """
+    Runs verify_password for slow schemes on a fixed thread pool. At most `max_pending` checks may
+    be queued or running; beyond that verify() fails fast with VerifierBusy instead of piling up
+    requests. Keeps per-scheme latency counters (time spent waiting for a worker and hashing).
+    """
+
+    INLINE_SCHEMES = ('sha256-hex',)
+
+    def __init__(self, workers=WORKERS, max_pending=MAX_PENDING, timeout=VERIFY_TIMEOUT):
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-check')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.metrics = {}
+
+    def _record(self, scheme, wait_ms, run_ms):
+        with self._lock:
+            m = self.metrics.setdefault(scheme, {'count': 0, 'wait_ms': 0.0, 'run_ms': 0.0, 'max_ms': 0.0})
+            m['count'] += 1
+            m['wait_ms'] += wait_ms
+            m['run_ms'] += run_ms
+            m['max_ms'] = max(m['max_ms'], wait_ms + run_ms)
+
+    def _run(self, scheme, stored, provided, queued_at):
+        started = time.perf_counter()
+        try:
+            return verify_password(stored, provided)
+        finally:
+            done = time.perf_counter()
+            self._record(scheme, (started - queued_at) * 1000, (done - started) * 1000)
+
+    def verify(self, stored, provided):
+        scheme = hash_scheme(stored)
+        if scheme in self.INLINE_SCHEMES:
+            # a single SHA-256 is cheaper than a thread hand-off
+            return self._run(scheme, stored, provided, time.perf_counter())
+
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise VerifierBusy("password verification queue is full")
+        try:
+            future = self._executor.submit(self._run, scheme, stored, provided, time.perf_counter())
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _f: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise VerifierBusy("password verification timed out")
+
+    def stats(self):
+        with self._lock:
+            schemes = {
+                name: {
+                    'count': m['count'],
+                    'avg_wait_ms': round(m['wait_ms'] / m['count'], 2),
+                    'avg_run_ms': round(m['run_ms'] / m['count'], 2),
+                    'max_ms': round(m['max_ms'], 2),
+                }
+                for name, m in self.metrics.items()
+            }
+            return {'rejected': self.rejected, 'schemes': schemes}
+
+
+verifier = PasswordVerifier()
+
+
+def check_password(stored_password, provided_password):
+    """verify_password through the shared worker pool; raises VerifierBusy when saturated."""
+    return verifier.verify(stored_password, provided_password)
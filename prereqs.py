@@ -0,0 +1,90 @@
+# prereqs.py
+# Course prerequisite graph: CoursePrerequisite as an adjacency map plus its transitive closure,
+# kept current edge by edge so cycle checks and registration checks never walk the graph.
+import threading
+
+
+class PrerequisiteCycle(ValueError):
+    """Raised when adding a prerequisite would make a course (indirectly) require itself."""
+
+
+class PrereqGraph:
+    """
+    direct[c]     courses listed as prerequisites of c
+    closure[c]    every course c requires, directly or through a chain
+    dependents[p] every course that requires p, directly or through a chain
+    Closure sets are frozensets replaced on change, so readers need no lock; writers serialize
+    on the graph's own lock.
+    """
+
+    def __init__(self, pairs=()):
+        self.direct = {}
+        self.closure = {}
+        self.dependents = {}
+        self._lock = threading.Lock()
+        for course_id, prereq_id in pairs:
+            self.direct.setdefault(course_id, set()).add(prereq_id)
+        for course_id in list(self.direct):
+            self._set_closure(course_id, self._walk(course_id))
+
+    def _walk(self, course_id):
+        seen = set()
+        stack = list(self.direct.get(course_id, ()))
+        while stack:
+            p = stack.pop()
+            if p not in seen:
+                seen.add(p)
+                stack.extend(self.direct.get(p, ()))
+        seen.discard(course_id)
+        return frozenset(seen)
+
+    def _set_closure(self, course_id, new):
+        old = self.closure.get(course_id, frozenset())
+        for p in old - new:
+            self.dependents[p] = self.dependents[p] - {course_id}
+        for p in new - old:
+            self.dependents[p] = self.dependents.get(p, frozenset()) | {course_id}
+        self.closure[course_id] = new
+
+    def requires(self, course_id, prereq_id):
+        return prereq_id in self.closure.get(course_id, ())
+
+    def would_cycle(self, course_id, prereq_id):
+        return course_id == prereq_id or self.requires(prereq_id, course_id)
+
+    def add(self, course_id, prereq_id):
+        with self._lock:
+            if self.would_cycle(course_id, prereq_id):
+                raise PrerequisiteCycle(f"course {prereq_id} already requires course {course_id}")
+            if prereq_id in self.direct.get(course_id, ()):
+                return
+            self.direct.setdefault(course_id, set()).add(prereq_id)
+            gained = self.closure.get(prereq_id, frozenset()) | {prereq_id}
+            for c in self.dependents.get(course_id, frozenset()) | {course_id}:
+                self._set_closure(c, self.closure.get(c, frozenset()) | gained)
+
+    def remove(self, course_id, prereq_id):
+        with self._lock:
+            if prereq_id not in self.direct.get(course_id, ()):
+                return
+            self.direct[course_id].discard(prereq_id)
+            # only courses that went through course_id can lose anything
+            for c in self.dependents.get(course_id, frozenset()) | {course_id}:
+                self._set_closure(c, self._walk(c))
+
+    def pairs(self):
+        return [(c, p) for c, prereqs in self.direct.items() for p in prereqs]
+
+    def missing(self, course_id, completed):
+        """
+        Direct prerequisites of `course_id` not covered by the set of `completed` course IDs.
+        A prerequisite also counts as met when a completed course itself requires it.
+        """
+        missing = set()
+        for p in self.direct.get(course_id, ()):
+            if p in completed:
+                continue
+            if p in self.dependents and not self.dependents[p].isdisjoint(completed):
+                continue
+            missing.add(p)
+        return missing
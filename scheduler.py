@@ -0,0 +1,187 @@
+# scheduler.py
+# Assigns a timeslot and classroom to every section of a term so no classroom and no instructor
+# is double-booked. Greedy placement, most constrained sections first, then a repair pass that
+# moves one blocking section aside; both stop when the time budget runs out.
+# Pure Python over plain dicts: the app loads the term and writes the result back.
+import time
+from collections import defaultdict
+
+import timetable
+
+
+class SolveResult:
+
+    def __init__(self):
+        self.assignments = {}
+        self.unplaced = []
+        self.elapsed = 0.0
+        self.timed_out = False
+
+    def changes(self, sections):
+        """Sections whose (timeslotID, classroomID) differ from their current values."""
+        return [s for s in sections
+                if s['sectionID'] in self.assignments
+                and self.assignments[s['sectionID']] != (s.get('timeslotID'), s.get('classroomID'))]
+
+
+def slot_overlaps(timeslots):
+    """timeslotID -> set of timeslotIDs that overlap it (itself included)."""
+    slots = [(t['timeslotID'], t['day_of_week'], timetable.to_minutes(t['start_time']), timetable.to_minutes(t['end_time']))
+             for t in timeslots]
+    overlaps = {sid: {sid} for sid, _, _, _ in slots}
+    for (a, day, start, end) in slots:
+        for (b, other_day, other_start, other_end) in slots:
+            if a != b and day == other_day and start < other_end and other_start < end:
+                overlaps[a].add(b)
+    return overlaps
+
+
+class _Board:
+    """Current placements plus the per-room and per-instructor slot occupancy used to test moves."""
+
+    def __init__(self, overlaps):
+        self.overlaps = overlaps
+        self.room_slots = defaultdict(dict)        # timeslotID -> {classroomID: sectionID}
+        self.instructor_slots = defaultdict(dict)  # instructorID -> {timeslotID: sectionID}
+        self.placed = {}
+
+    def blockers(self, section, slot, room):
+        """Sections in the way of placing `section` at (slot, room)."""
+        found = set()
+        for other_slot in self.overlaps[slot]:
+            occupant = self.room_slots[other_slot].get(room)
+            if occupant is not None:
+                found.add(occupant)
+            if section['instructorID']:
+                occupant = self.instructor_slots[section['instructorID']].get(other_slot)
+                if occupant is not None:
+                    found.add(occupant)
+        found.discard(section['sectionID'])
+        return found
+
+    def instructor_free(self, section, slot):
+        if not section['instructorID']:
+            return True
+        busy = self.instructor_slots[section['instructorID']]
+        return not any(other in busy for other in self.overlaps[slot])
+
+    def free_room(self, slot, rooms, prefer=None):
+        taken = set()
+        for other_slot in self.overlaps[slot]:
+            taken.update(self.room_slots[other_slot])
+        if prefer is not None and prefer not in taken:
+            return prefer
+        for room in rooms:
+            if room not in taken:
+                return room
+        return None
+
+    def place(self, section, slot, room):
+        self.placed[section['sectionID']] = (slot, room)
+        self.room_slots[slot][room] = section['sectionID']
+        if section['instructorID']:
+            self.instructor_slots[section['instructorID']][slot] = section['sectionID']
+
+    def remove(self, section):
+        slot, room = self.placed.pop(section['sectionID'])
+        del self.room_slots[slot][room]
+        if section['instructorID']:
+            del self.instructor_slots[section['instructorID']][slot]
+
+
+def _try_place(board, section, slot_order, rooms):
+    for slot in slot_order(section):
+        if not board.instructor_free(section, slot):
+            continue
+        room = board.free_room(slot, rooms, prefer=section.get('classroomID'))
+        if room is not None:
+            board.place(section, slot, room)
+            return True
+    return False
+
+
+def solve(sections, classrooms, timeslots, budget=5.0, keep_current=True):
+    """
+    Assign (timeslotID, classroomID) to each section.
+    sections    dicts with sectionID, instructorID and current timeslotID / classroomID
+    classrooms  classroom IDs
+    timeslots   dicts with timeslotID, day_of_week, start_time, end_time
+    keep_current=True keeps every current placement that doesn't clash and only moves the rest.
+    Returns a SolveResult; sections that could not be placed within `budget` seconds are listed
+    in result.unplaced (they keep their current values).
+    """
+    started = time.monotonic()
+    deadline = started + budget
+    result = SolveResult()
+    overlaps = slot_overlaps(timeslots)
+    rooms = list(classrooms)
+    known_rooms = set(rooms)
+    board = _Board(overlaps)
+    by_id = {s['sectionID']: s for s in sections}
+
+    # slots used least so far first, which spreads sections across the week
+    slot_load = defaultdict(int)
+
+    def slot_order(section):
+        current = section.get('timeslotID')
+        return sorted(overlaps, key=lambda sid: (sid != current, slot_load[sid], sid))
+
+    pending = []
+    if keep_current:
+        for s in sections:
+            slot, room = s.get('timeslotID'), s.get('classroomID')
+            if slot in overlaps and room in known_rooms and not board.blockers(s, slot, room):
+                board.place(s, slot, room)
+                slot_load[slot] += 1
+            else:
+                pending.append(s)
+    else:
+        pending = list(sections)
+
+    # most constrained first: instructors teaching the most sections
+    teaching = defaultdict(int)
+    for s in sections:
+        teaching[s['instructorID']] += 1
+    pending.sort(key=lambda s: (-teaching[s['instructorID']], s['sectionID']))
+
+    unplaced = []
+    for s in pending:
+        if time.monotonic() > deadline:
+            result.timed_out = True
+            unplaced.append(s)
+            continue
+        if _try_place(board, s, slot_order, rooms):
+            slot_load[board.placed[s['sectionID']][0]] += 1
+        else:
+            unplaced.append(s)
+
+    # repair: put an unplaced section where exactly one other section is in the way and re-place that one
+    still_unplaced = []
+    for s in unplaced:
+        placed = False
+        for slot in slot_order(s):
+            if time.monotonic() > deadline:
+                result.timed_out = True
+                break
+            for room in rooms:
+                in_way = board.blockers(s, slot, room)
+                if len(in_way) != 1:
+                    continue
+                other = by_id[next(iter(in_way))]
+                saved = board.placed[other['sectionID']]
+                board.remove(other)
+                board.place(s, slot, room)
+                if _try_place(board, other, slot_order, rooms):
+                    placed = True
+                    break
+                board.remove(s)
+                board.place(other, *saved)
+            if placed:
+                break
+        if not placed:
+            still_unplaced.append(s['sectionID'])
+
+    result.assignments = dict(board.placed)
+    result.unplaced = still_unplaced
+    result.elapsed = time.monotonic() - started
+    return result
@@ -0,0 +1,79 @@
+# search.py
+# In-process course catalog search. A trigram index over course number and name finds substring
+# matches (the same courses `course_number LIKE '%q%' OR course_name LIKE '%q%'` would) without
+# scanning Course, and results are ranked for autocomplete.
+from collections import defaultdict
+
+
+def normalize(text):
+    return (text or '').strip().lower()
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class CourseIndex:
+    """
+    Immutable index over course dicts (courseID, course_number, course_name). Build a new one
+    when the catalog changes instead of updating it, so readers never need a lock.
+    """
+
+    def __init__(self, courses):
+        self.courses = {}
+        self._text = {}
+        grams = defaultdict(set)
+        for course in courses:
+            course_id = course['courseID']
+            number = normalize(course['course_number'])
+            name = normalize(course['course_name'])
+            self.courses[course_id] = course
+            self._text[course_id] = (number, name)
+            for gram in trigrams(number) | trigrams(name):
+                grams[gram].add(course_id)
+        self._grams = {gram: frozenset(ids) for gram, ids in grams.items()}
+
+    def __len__(self):
+        return len(self.courses)
+
+    def _candidates(self, q):
+        grams = trigrams(q)
+        if not grams:
+            # one or two characters: no trigram to look up, check every course
+            return self._text.keys()
+        postings = sorted((self._grams.get(gram, frozenset()) for gram in grams), key=len)
+        ids = set(postings[0])
+        for posting in postings[1:]:
+            ids &= posting
+            if not ids:
+                break
+        return ids
+
+    def matching_ids(self, q):
+        """IDs of courses whose number or name contains `q` (case-insensitive)."""
+        q = normalize(q)
+        if not q:
+            return set(self.courses)
+        return {cid for cid in self._candidates(q) if q in self._text[cid][0] or q in self._text[cid][1]}
+
+    def _rank(self, course_id, q):
+        number, name = self._text[course_id]
+        if number == q:
+            tier = 0
+        elif number.startswith(q):
+            tier = 1
+        elif name.startswith(q):
+            tier = 2
+        elif (' ' + q) in (' ' + name):
+            tier = 3
+        else:
+            tier = 4
+        return tier, number
+
+    def search(self, q, limit=10):
+        """Matching courses, best first: exact number, number prefix, name prefix, word prefix, substring."""
+        q = normalize(q)
+        if not q:
+            return []
+        ranked = sorted(self.matching_ids(q), key=lambda cid: self._rank(cid, q))
+        return [dict(self.courses[cid]) for cid in ranked[:limit]]
@@ -0,0 +1,156 @@
+# timetable.py
+# Weekly time intervals for timetable checks: overlap lookups against one timetable (a student's,
+# a room's, an instructor's) and a sweep that finds every overlap in a whole term at once.
+# Times are minutes after midnight; intervals are [start, end), so back-to-back slots don't clash.
+import bisect
+import heapq
+import threading
+from datetime import timedelta
+
+
+def to_minutes(value):
+    """Minutes after midnight for a TIME value (timedelta from MySQL, datetime.time or 'HH:MM[:SS]')."""
+    if isinstance(value, timedelta):
+        return int(value.total_seconds()) // 60
+    if hasattr(value, 'hour'):
+        return value.hour * 60 + value.minute
+    hours, minutes = str(value).split(':')[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+class IntervalIndex:
+    """
+    Intervals grouped by partition (e.g. (termID, day_of_week)), each partition kept sorted by
+    start. overlapping() bisects to the few candidates that can overlap, using the longest
+    interval in the partition to bound how early an overlapping one can start.
+    Keys (section IDs) must be unique and mutually comparable.
+    """
+
+    def __init__(self):
+        self._parts = {}
+        self._where = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, key):
+        return key in self._where
+
+    def add(self, partition, start, end, key):
+        with self._lock:
+            self._remove(key)
+            part = self._parts.setdefault(partition, {'entries': [], 'longest': 0})
+            bisect.insort(part['entries'], (start, end, key))
+            part['longest'] = max(part['longest'], end - start)
+            self._where[key] = (partition, start, end)
+
+    def remove(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        where = self._where.pop(key, None)
+        if where is None:
+            return
+        partition, start, end = where
+        entries = self._parts[partition]['entries']
+        i = bisect.bisect_left(entries, (start, end, key))
+        if i < len(entries) and entries[i][2] == key:
+            del entries[i]
+
+    def overlapping(self, partition, start, end, exclude=None):
+        """Keys of intervals in `partition` that overlap [start, end), other than `exclude`."""
+        with self._lock:
+            part = self._parts.get(partition)
+            if not part:
+                return []
+            entries = part['entries']
+            lo = bisect.bisect_left(entries, (start - part['longest'],))
+            hi = bisect.bisect_left(entries, (end,))
+            return [key for s, e, key in entries[lo:hi] if e > start and key != exclude]
+
+
+def find_conflicts(intervals):
+    """
+    Every overlapping pair among (partition, start, end, key) tuples, as (partition, key_a, key_b)
+    with key_a starting no later than key_b. One sort and one sweep per partition.
+    """
+    by_partition = {}
+    for partition, start, end, key in intervals:
+        by_partition.setdefault(partition, []).append((start, end, key))
+    conflicts = []
+    for partition, items in by_partition.items():
+        items.sort()
+        active = []  # heap of (end, start, key) still open at the sweep position
+        for start, end, key in items:
+            while active and active[0][0] <= start:
+                heapq.heappop(active)
+            for _, _, other in sorted(active, key=lambda a: (a[1], a[2])):
+                conflicts.append((partition, other, key))
+            heapq.heappush(active, (end, start, key))
+    return conflicts
+
+
+class TermSchedule:
+    """
+    One term's sections indexed by classroom and by instructor, for double-booking checks.
+    Sections are dicts with sectionID, classroomID, instructorID, day_of_week, start and end
+    (minutes); sections without a timeslot are tracked but never clash.
+    """
+
+    RESOURCES = ('classroomID', 'instructorID')
+
+    def __init__(self, sections=()):
+        self.index = IntervalIndex()
+        self.sections = {}
+        self._lock = threading.RLock()
+        for section in sections:
+            self.place(section)
+
+    def place(self, section):
+        section_id = section['sectionID']
+        with self._lock:
+            self.unplace(section_id)
+            self.sections[section_id] = section
+            if section.get('day_of_week') is None:
+                return
+            for resource in self.RESOURCES:
+                if section.get(resource):
+                    self.index.add((resource, section[resource], section['day_of_week']),
+                                   section['start'], section['end'], (resource, section_id))
+
+    def unplace(self, section_id):
+        with self._lock:
+            if self.sections.pop(section_id, None) is None:
+                return
+            for resource in self.RESOURCES:
+                self.index.remove((resource, section_id))
+
+    def clashes(self, section):
+        """(resource, other sectionID) pairs the section would double-book if placed as given."""
+        if section.get('day_of_week') is None:
+            return []
+        found = []
+        for resource in self.RESOURCES:
+            if section.get(resource):
+                partition = (resource, section[resource], section['day_of_week'])
+                for _, other in self.index.overlapping(partition, section['start'], section['end'],
+                                                       exclude=(resource, section.get('sectionID'))):
+                    found.append((resource, other))
+        return found
+
+    def conflicts(self):
+        """Every double booking in the term as (resource, resource id, day, sectionID, sectionID)."""
+        intervals = []
+        with self._lock:
+            sections = list(self.sections.items())
+        for section_id, section in sections:
+            if section.get('day_of_week') is None:
+                continue
+            for resource in self.RESOURCES:
+                if section.get(resource):
+                    intervals.append(((resource, section[resource], section['day_of_week']),
+                                      section['start'], section['end'], section_id))
+        return [(resource, resource_id, day, a, b)
+                for (resource, resource_id, day), a, b in find_conflicts(intervals)]